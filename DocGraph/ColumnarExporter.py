@@ -0,0 +1,79 @@
+
+import numpy
+
+from graph_utils import edge_arrays
+
+import json
+import os
+
+
+class ColumnarExporter:
+    '''
+        Writes a graph as a directory of .npy columns, for analytics jobs
+        that would rather not parse the viewer's json. Nodes are numbered in
+        output order and edges are int32 source/target arrays; strings are
+        stored as tables (utf-8 bytes plus int64 offsets, so string i is
+        data[offsets[i]:offsets[i + 1]]). Every column can be np.load-ed
+        with mmap_mode='r' (see load_columns), so readers don't copy the
+        edge arrays.
+    '''
+
+    MANIFEST = 'columns.json'
+
+    NODE_STRING_COLUMNS = ['name', 'filepath', 'notes', 'last_modified', 'color']
+
+    def __init__(self, edge_types):
+        # edge types are stored as an index into this list
+        self.edge_types = list(edge_types)
+
+    def write(self, docnodes, dirname):
+        '''
+            docnodes: validated docnode objects (every edge points at one of them)
+        '''
+        docnodes = list(docnodes)
+        source, target, etype = edge_arrays(docnodes, self.edge_types)
+
+        columns = {'edge_source': source,
+                   'edge_target': target,
+                   'edge_type': etype}
+        for column in self.NODE_STRING_COLUMNS:
+            strings = (getattr(node, column) or '' for node in docnodes)
+            self._add_strings(columns, 'node_' + column, strings)
+        self._add_strings(columns, 'edge_type_names', self.edge_types)
+
+        os.makedirs(dirname, exist_ok=True)
+        for name, array in columns.items():
+            numpy.save(os.path.join(dirname, name + '.npy'), array)
+
+        manifest = {'node_count': len(docnodes),
+                    'edge_count': len(source),
+                    'columns': sorted(columns)}
+        with open(os.path.join(dirname, self.MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+    def _add_strings(self, columns, name, strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(e) for e in encoded], out=offsets[1:])
+        columns[name + '.data'] = numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8)
+        columns[name + '.offsets'] = offsets
+
+
+def load_columns(dirname, mmap_mode='r'):
+    '''
+        returns {column name: array}; by default every array is a read-only
+        memory map of its file
+    '''
+    with open(os.path.join(dirname, ColumnarExporter.MANIFEST)) as f:
+        manifest = json.load(f)
+    return {name: numpy.load(os.path.join(dirname, name + '.npy'), mmap_mode=mmap_mode)
+            for name in manifest['columns']}
+
+
+def get_string(columns, name, i):
+    '''
+        returns string i of a string table, e.g. get_string(columns, 'node_name', 0)
+    '''
+    offsets = columns[name + '.offsets']
+    data = columns[name + '.data']
+    return bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8')
@@ -0,0 +1,113 @@
+
+import json
+import os
+import time
+
+
+class CheckpointMismatchError(Exception):
+    '''
+        raised by CrawlCheckpoint.resume when the checkpoint on disk was
+        written by a different crawl
+    '''
+    pass
+
+
+class CrawlCheckpoint:
+    '''
+        Append-only log of a crawl's progress: a header line describing the
+        crawl, then one json line per finished directory. Writing a line is
+        O(directory), so checkpointing a whole crawl stays linear.
+    '''
+
+    def __init__(self, path, fsync_interval=30):
+        self.path = path
+        # lines are flushed as they're written (enough to survive ctrl-c or
+        # an OOM kill); fsync every so often to survive the machine going away
+        self.fsync_interval = fsync_interval
+
+        self.f = None
+        self.last_fsync = 0
+
+    def start(self, header):
+        '''
+            starts a new checkpoint, replacing any old one
+        '''
+        self.close()
+        self.f = open(self.path, 'w')
+        self._write(header)
+        self.sync()
+
+    def resume(self, header):
+        '''
+            returns the records of an earlier crawl with the same header and
+            continues appending to it. Starts a new checkpoint (and returns
+            no records) if there isn't one yet
+        '''
+        if not os.path.isfile(self.path):
+            self.start(header)
+            return []
+
+        records = []
+        good_length = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # a line cut short by the interruption - drop it and
+                    # anything after it
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                records.append(record)
+                good_length += len(line)
+
+        if len(records) == 0:
+            self.start(header)
+            return []
+        if records[0] != header:
+            raise CheckpointMismatchError("checkpoint {} is for a different crawl ({}), not {}"
+                                          .format(self.path, records[0], header))
+
+        self.close()
+        self.f = open(self.path, 'r+')
+        self.f.truncate(good_length)
+        self.f.seek(good_length)
+        return records[1:]
+
+    def record(self, record):
+        self._write(record)
+        if time.monotonic() - self.last_fsync > self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.last_fsync = time.monotonic()
+
+    def close(self):
+        if self.f is not None:
+            self.sync()
+            self.f.close()
+            self.f = None
+
+    def abandon(self):
+        '''
+            stops recording without syncing, as when the crawl is killed;
+            what's been written so far is kept for a later resume
+        '''
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def remove(self):
+        '''
+            call once the crawl's output is safely written
+        '''
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def _write(self, record):
+        self.f.write(json.dumps(record) + '\n')
+        self.f.flush()
@@ -0,0 +1,119 @@
+import os
+import stat
+import time
+
+
+# read_blocks reads files this many characters at a time, checking the
+# limits between blocks
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class FileLimits:
+    '''
+        Per-file guardrails for parse_docfile, so one pathological file
+        (a huge log, a minified file with no newlines) can't stall or
+        blow up a crawl. A limit of None is not enforced.
+    '''
+    DEFAULT_MAX_LINE_LENGTH = 1024 * 1024
+
+    def __init__(self, max_bytes=None, max_line_length=DEFAULT_MAX_LINE_LENGTH,
+                 max_seconds=None):
+        self.max_bytes = max_bytes
+        self.max_line_length = max_line_length
+        self.max_seconds = max_seconds
+
+
+class FileLimitError(Exception):
+    '''
+        raised by parse_docfile when a file breaks one of its FileLimits
+    '''
+    def __init__(self, filepath, reason):
+        super().__init__('{}: {}'.format(filepath, reason))
+        self.filepath = filepath
+        self.reason = reason
+
+
+def check_file(filepath, limits):
+    '''
+        checks the limits that can be checked before reading a file
+    '''
+    statbuf = os.stat(filepath)
+    if not stat.S_ISREG(statbuf.st_mode):
+        # reading a fifo or device could block forever
+        raise FileLimitError(filepath, 'not a regular file')
+    if limits.max_bytes is not None and statbuf.st_size > limits.max_bytes:
+        raise FileLimitError(filepath, 'file is {} bytes (limit {})'
+                             .format(statbuf.st_size, limits.max_bytes))
+    return statbuf
+
+
+def check_seconds(filepath, limits, started):
+    if (limits.max_seconds is not None and
+            time.monotonic() - started > limits.max_seconds):
+        raise FileLimitError(filepath, 'took longer than {} seconds'
+                             .format(limits.max_seconds))
+
+
+def read_blocks(filepath, limits, errors='strict'):
+    '''
+        yields the text of filepath a block of whole lines at a time (only
+        the last block can end without a newline, and then it holds just
+        that line), raising FileLimitError as soon as the file breaks one
+        of limits. A block is about READ_BLOCK_SIZE characters plus at most
+        one line, so memory is bounded by limits.max_line_length. Raises
+        UnicodeDecodeError if the file can't be decoded, unless errors
+        (as for open) says otherwise
+    '''
+    check_file(filepath, limits)
+    started = time.monotonic()
+
+    with open(filepath, 'r', errors=errors) as f:
+        # the unfinished last line of the blocks read so far
+        pieces = []
+        pending = 0
+        while True:
+            check_seconds(filepath, limits, started)
+            block = f.read(READ_BLOCK_SIZE)
+            if len(block) == 0:
+                break
+
+            if limits.max_bytes is not None and f.buffer.tell() > limits.max_bytes:
+                # the file grew since we checked its size
+                raise FileLimitError(filepath, 'read more than {} bytes'
+                                     .format(limits.max_bytes))
+            if (limits.max_line_length is not None and
+                    has_long_line(block, pending, limits.max_line_length)):
+                raise FileLimitError(filepath, 'line longer than {} characters'
+                                     .format(limits.max_line_length))
+
+            cut = block.rfind('\n') + 1
+            if cut == 0:
+                pieces.append(block)
+                pending += len(block)
+                continue
+            if len(pieces) == 0 and cut == len(block):
+                yield block
+            else:
+                pieces.append(block[:cut])
+                yield ''.join(pieces)
+            pieces = [block[cut:]] if cut < len(block) else []
+            pending = len(block) - cut
+
+        if pending > 0:
+            yield ''.join(pieces)
+
+
+def has_long_line(text, pending, max_line_length):
+    '''
+        True if text, which continues a line already pending characters
+        long, has a line longer than max_line_length. Jumps from each line
+        start to the last newline within max_line_length + 1 characters of
+        it, so short lines are never looked at one by one
+    '''
+    start = -pending
+    while len(text) - start > max_line_length:
+        line_end = text.rfind('\n', max(start, 0), start + max_line_length + 1)
+        if line_end < 0:
+            return True
+        start = line_end + 1
+    return False
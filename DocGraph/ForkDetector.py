@@ -0,0 +1,247 @@
+
+from FileLimits import FileLimits, FileLimitError, read_blocks
+
+import numpy
+
+import collections
+import json
+import os
+import re
+import zlib
+
+
+# the annotations parse_docfile reads, which always differ between forks
+ANNOTATION_REGEX = re.compile("@(name|notes?|imports?|forks?|uses?):")
+
+
+class ForkDetector:
+    '''
+        Finds near-duplicate files (likely forks) without comparing every
+        pair: each file gets a MinHash signature of its shingles (runs of
+        shingle_size consecutive non-blank lines), and locality-sensitive
+        hashing buckets signatures by band so only files that agree on a
+        whole band are compared.
+
+        Signatures are kept by path, size and mtime, so a rerun (with the
+        same detector, or a new one reading the cache) only hashes files
+        that changed. The cache is two files: cache_path.npy,
+        a uint32 matrix with a signature per row (memory-mapped when
+        loaded), and cache_path.json, an index of {path: [size, mtime_ns,
+        row]} (row -1 for files with nothing to sign).
+    '''
+
+    # shingle hashes are folded into a signature this many at a time
+    BLOCK_SIZE = 4096
+
+    def __init__(self, num_hashes=128, bands=16, threshold=0.8, shingle_size=3,
+                 max_bucket_size=100, cache_path=None, seed=0):
+        if num_hashes % bands != 0:
+            raise Exception("num_hashes ({}) must be a multiple of bands ({})"
+                            .format(num_hashes, bands))
+        self.num_hashes = num_hashes
+        self.bands = bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        # a bucket this big is boilerplate shared by many files, not a fork
+        self.max_bucket_size = max_bucket_size
+        self.seed = seed
+
+        # hash i of shingle h is the high half of (a[i] * h + b[i]) mod 2^64
+        rng = numpy.random.default_rng(seed)
+        self.a = rng.integers(0, 2**63, num_hashes, dtype=numpy.uint64) * 2 + 1
+        self.b = rng.integers(0, 2**63, num_hashes, dtype=numpy.uint64)
+
+        # signatures to reuse for unchanged files: {path: [size, mtime_ns,
+        # row in cache_matrix, or -1]}, from the cache or the last run
+        self.cache_path = cache_path
+        self.cache_index = {}
+        self.cache_matrix = None
+        if cache_path is not None:
+            self.load_cache()
+
+        # signatures of the files added in this run, one per row of matrix
+        self.matrix = numpy.empty((1024, num_hashes), dtype=numpy.uint32)
+        self.row_count = 0
+        # path: ([size, mtime_ns], row in matrix, or -1 if there's no signature)
+        self.signatures = {}
+        self.hashed_count = 0
+
+    def start(self):
+        '''
+            starts a run: the files added from here on make up the
+            signatures, and those of the last run are only kept to be reused
+        '''
+        if len(self.signatures) > 0:
+            self.cache_index = {path: key + [row]
+                                for path, (key, row) in self.signatures.items()}
+            self.cache_matrix = self.matrix[:self.row_count]
+            self.matrix = numpy.empty((1024, self.num_hashes), dtype=numpy.uint32)
+            self.row_count = 0
+            self.signatures = {}
+        self.hashed_count = 0
+
+    def cache_header(self):
+        return {'num_hashes': self.num_hashes,
+                'shingle_size': self.shingle_size,
+                'seed': self.seed}
+
+    def load_cache(self):
+        index_path = self.cache_path + '.json'
+        matrix_path = self.cache_path + '.npy'
+        if not (os.path.isfile(index_path) and os.path.isfile(matrix_path)):
+            return
+        with open(index_path) as f:
+            cache = json.load(f)
+        # signatures made with other settings can't be compared with ours
+        if cache.get('header') != self.cache_header():
+            return
+        matrix = numpy.load(matrix_path, mmap_mode='r')
+        if matrix.ndim != 2 or matrix.shape[1] != self.num_hashes:
+            return
+        self.cache_index = cache['files']
+        self.cache_matrix = matrix
+
+    def save_cache(self):
+        '''
+            keeps the signatures of the files added in this run
+        '''
+        files = {}
+        for filepath, (key, row) in self.signatures.items():
+            files[filepath] = key + [row]
+
+        # written beside the old files and moved over them, since the old
+        # matrix may still be mapped
+        with open(self.cache_path + '.npy.tmp', 'wb') as f:
+            numpy.save(f, self.matrix[:self.row_count])
+        with open(self.cache_path + '.json.tmp', 'w') as f:
+            json.dump({'header': self.cache_header(), 'files': files}, f)
+        os.replace(self.cache_path + '.npy.tmp', self.cache_path + '.npy')
+        os.replace(self.cache_path + '.json.tmp', self.cache_path + '.json')
+
+    def add(self, filepath, limits=None):
+        '''
+            computes (or reuses, if the file hasn't changed) the signature
+            of filepath, reading it within limits. A file that breaks them
+            gets no signature
+        '''
+        statbuf = os.stat(filepath)
+        key = [statbuf.st_size, statbuf.st_mtime_ns]
+        if filepath in self.signatures and self.signatures[filepath][0] == key:
+            return
+
+        cached = self.cache_index.get(filepath)
+        if cached is not None and cached[:2] == key:
+            signature = None
+            if cached[2] >= 0:
+                signature = self.cache_matrix[cached[2]]
+        else:
+            self.hashed_count += 1
+            try:
+                signature = self.file_signature(filepath, limits)
+            except FileLimitError:
+                # not kept, so it's tried again next run
+                return
+
+        row = -1
+        if signature is not None:
+            row = self._append(signature)
+        self.signatures[filepath] = (key, row)
+
+    def _append(self, signature):
+        if self.row_count == len(self.matrix):
+            grown = numpy.empty((2 * len(self.matrix), self.num_hashes), dtype=numpy.uint32)
+            grown[:self.row_count] = self.matrix
+            self.matrix = grown
+        self.matrix[self.row_count] = signature
+        self.row_count += 1
+        return self.row_count - 1
+
+    def file_signature(self, filepath, limits=None):
+        '''
+            the MinHash signature of the shingles of filepath (None if it
+            has none): the crc32 of every run of shingle_size non-blank
+            lines, whitespace-normalized, with annotations left out since
+            they always differ between forks. The file is read with
+            read_blocks (undecodable bytes replaced), so it raises
+            FileLimitError if it breaks limits, and hashes are folded into
+            the signature a block at a time, so memory doesn't grow with
+            the file
+        '''
+        limits = limits if limits is not None else FileLimits()
+        lines = collections.deque(maxlen=self.shingle_size)
+        signature = None
+        block = []
+        for text in read_blocks(filepath, limits, errors='replace'):
+            for line in text.split('\n'):
+                line = ' '.join(line.split())
+                if len(line) == 0 or ('@' in line and ANNOTATION_REGEX.search(line)):
+                    continue
+                lines.append(line)
+                if len(lines) == self.shingle_size:
+                    block.append(zlib.crc32('\n'.join(lines).encode('utf-8')))
+                    if len(block) == self.BLOCK_SIZE:
+                        signature = self._fold(signature, block)
+                        block = []
+        if signature is None and len(block) == 0 and len(lines) > 0:
+            # too short for a full shingle
+            block.append(zlib.crc32('\n'.join(lines).encode('utf-8')))
+        if len(block) > 0:
+            signature = self._fold(signature, block)
+        return signature
+
+    def signature(self, shingles):
+        '''
+            the MinHash signature of an array of shingle hashes (None if empty)
+        '''
+        signature = None
+        for start in range(0, len(shingles), self.BLOCK_SIZE):
+            signature = self._fold(signature, shingles[start:start + self.BLOCK_SIZE])
+        return signature
+
+    def _fold(self, signature, block):
+        '''
+            signature updated with a block of shingle hashes
+        '''
+        block = numpy.asarray(block, dtype=numpy.uint64)
+        hashed = (self.a[:, None] * block[None, :] + self.b[:, None]) >> numpy.uint64(32)
+        minimum = hashed.min(axis=1).astype(numpy.uint32)
+        if signature is None:
+            return minimum
+        return numpy.minimum(signature, minimum)
+
+    def suggestions(self, docnodes):
+        '''
+            returns [(older docnode, newer docnode, similarity)] for every pair
+            of docnodes whose estimated similarity is at least threshold
+        '''
+        docnodes = [n for n in docnodes
+                    if self.signatures.get(n.filepath, (None, -1))[1] >= 0]
+        if len(docnodes) < 2:
+            return []
+        signatures = self.matrix[[self.signatures[n.filepath][1] for n in docnodes]]
+
+        rows = self.num_hashes // self.bands
+        candidates = set()
+        for band in range(self.bands):
+            buckets = collections.defaultdict(list)
+            band_rows = numpy.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+            for i, row in enumerate(band_rows):
+                buckets[row.tobytes()].append(i)
+            for bucket in buckets.values():
+                if 1 < len(bucket) <= self.max_bucket_size:
+                    for x in range(len(bucket)):
+                        for y in range(x + 1, len(bucket)):
+                            candidates.add((bucket[x], bucket[y]))
+
+        suggestions = []
+        for i, j in sorted(candidates):
+            similarity = float((signatures[i] == signatures[j]).mean())
+            if similarity < self.threshold:
+                continue
+            first, second = docnodes[i], docnodes[j]
+            # the fork is the newer file
+            if (self.signatures[first.filepath][0][1], first.name) > \
+                    (self.signatures[second.filepath][0][1], second.name):
+                first, second = second, first
+            suggestions.append((first, second, similarity))
+        return suggestions
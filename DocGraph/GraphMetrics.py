@@ -0,0 +1,203 @@
+
+import numpy
+
+from graph_utils import edge_arrays, strongly_connected_components
+
+
+class GraphMetrics:
+    '''
+        Per-node graph metrics, computed with numpy over edge arrays rather
+        than per-node python loops. Edges point the same way as in the
+        viewer: from the imported/forked/used file (source) to the file
+        that declares the annotation (target).
+
+        - in_degree / out_degree: {edge type: count} of edges into / out of
+          the node (a file's own annotations are its in-edges)
+        - fan_in: number of files that depend on the node, directly or
+          through a chain of edges, i.e. everything a change to it could
+          affect. Exact for graphs of up to exact_limit strongly connected
+          components, estimated above that (see _reach_counts)
+        - fan_in_estimated: whether the node's fan_in is an estimate
+        - pagerank: PageRank with rank flowing from a file to the files
+          it imports, forks or uses, so widely depended-on files rank high
+    '''
+
+    def __init__(self, edge_types, damping=0.85, tolerance=1e-10, max_iterations=100,
+                 exact_limit=4096, estimate_rounds=32, seed=0):
+        self.edge_types = list(edge_types)
+        self.damping = damping
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+
+        self.exact_limit = exact_limit
+        self.estimate_rounds = estimate_rounds
+        self.seed = seed
+
+    def compute(self, docnodes):
+        '''
+            returns {metric name: array with one value per docnode}
+        '''
+        docnodes = list(docnodes)
+        n = len(docnodes)
+        source, target, etype = edge_arrays(docnodes, self.edge_types)
+
+        metrics = {}
+        for i, edge_type in enumerate(self.edge_types):
+            of_type = etype == i
+            metrics['in_degree_' + edge_type] = numpy.bincount(target[of_type], minlength=n)
+            metrics['out_degree_' + edge_type] = numpy.bincount(source[of_type], minlength=n)
+
+        # files reachable from a node are the ones with a path to it
+        # once the edges are reversed
+        metrics['fan_in'], metrics['fan_in_estimated'] = self._reach_counts(n, target, source)
+        metrics['pagerank'] = self._pagerank(n, source, target)
+        return metrics
+
+    def apply(self, docnodes):
+        '''
+            computes metrics and stores them on each docnode (as .metrics),
+            sizing nodes by pagerank
+        '''
+        docnodes = list(docnodes)
+        if len(docnodes) == 0:
+            return
+        metrics = self.compute(docnodes)
+
+        columns = {name: values.tolist() for name, values in metrics.items()}
+        pagerank = metrics['pagerank']
+        sizes = (1 + 9 * pagerank / pagerank.max()).tolist()
+        for i, docnode in enumerate(docnodes):
+            docnode.metrics = {
+                'in_degree': {t: columns['in_degree_' + t][i] for t in self.edge_types},
+                'out_degree': {t: columns['out_degree_' + t][i] for t in self.edge_types},
+                'fan_in': columns['fan_in'][i],
+                'fan_in_estimated': columns['fan_in_estimated'][i],
+                'pagerank': columns['pagerank'][i],
+            }
+            docnode.size = sizes[i]
+
+    def _pagerank(self, n, source, target):
+        # the walk goes from each target to its sources
+        out_degree = numpy.bincount(target, minlength=n).astype(numpy.float64)
+        dangling = out_degree == 0
+        weight = numpy.zeros(n)
+        weight[~dangling] = 1 / out_degree[~dangling]
+
+        rank = numpy.full(n, 1 / n)
+        for i in range(self.max_iterations):
+            spread = numpy.bincount(source, weights=(rank * weight)[target], minlength=n)
+            new_rank = ((1 - self.damping) / n +
+                        self.damping * (spread + rank[dangling].sum() / n))
+            change = numpy.abs(new_rank - rank).sum()
+            rank = new_rank
+            if change < self.tolerance:
+                break
+        return rank
+
+    def _reach_counts(self, n, source, target):
+        '''
+            for every node, the number of other nodes with a path to it, and
+            whether that number is an estimate.
+
+            Strongly connected components are condensed first (every node
+            in one is reached by the same nodes), then reachability flows
+            through the condensed graph one topological level at a time, so
+            every edge is visited once however deep the graph is. Levels
+            with only a few edges are done an edge at a time, which beats
+            numpy's per-call overhead on long chains.
+
+            Reachability is exact (a bitset of components per component)
+            for up to exact_limit components. Above that, set sizes are
+            estimated from the minimum of random exponential ranks over each
+            set (Cohen, 1997), except for components nothing else reaches
+        '''
+        if n == 0:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=bool)
+
+        # the edges into each node, numbered so that every component comes
+        # after the components with edges into it
+        order = numpy.argsort(target, kind='stable')
+        in_starts = numpy.zeros(n + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(target, minlength=n), out=in_starts[1:])
+        component_of, count = strongly_connected_components(in_starts.tolist(),
+                                                            source[order].tolist())
+        component_of = numpy.array(component_of, dtype=numpy.int64)
+        sizes = numpy.bincount(component_of, minlength=count)
+
+        # edges between components, without duplicates, grouped by target
+        c_source = component_of[source]
+        c_target = component_of[target]
+        between = c_source != c_target
+        keys = numpy.unique(c_target[between] * count + c_source[between])
+        c_source = keys % count
+        c_target = keys // count
+
+        # a component's level is one more than the highest level of a
+        # component with an edge into it
+        c_starts = numpy.zeros(count + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(c_target, minlength=count), out=c_starts[1:])
+        starts = c_starts.tolist()
+        sources = c_source.tolist()
+        levels = [0] * count
+        for c in range(count):
+            level = 0
+            for i in range(starts[c], starts[c + 1]):
+                if levels[sources[i]] >= level:
+                    level = levels[sources[i]] + 1
+            levels[c] = level
+        levels = numpy.array(levels, dtype=numpy.int64)
+
+        exact = count <= self.exact_limit
+        if exact:
+            # bit b of word w of component c is set if component 64 * w + b reaches c
+            reach = numpy.zeros((count, (count + 63) // 64), dtype=numpy.uint64)
+            components = numpy.arange(count)
+            reach[components, components // 64] = numpy.left_shift(
+                numpy.uint64(1), (components % 64).astype(numpy.uint64))
+            combine = numpy.bitwise_or
+        else:
+            # the minimum of a component's members' ranks is exponential with
+            # rate equal to its size
+            rng = numpy.random.default_rng(self.seed)
+            reach = rng.standard_exponential((count, self.estimate_rounds), dtype=numpy.float32)
+            reach /= sizes[:, None]
+            combine = numpy.minimum
+
+        by_level = numpy.argsort(levels[c_target], kind='stable')
+        c_source = c_source[by_level]
+        c_target = c_target[by_level]
+        level_starts = numpy.searchsorted(levels[c_target], numpy.arange(levels.max() + 2)).tolist()
+        sources = c_source.tolist()
+        targets = c_target.tolist()
+        for level in range(1, len(level_starts) - 1):
+            first, last = level_starts[level], level_starts[level + 1]
+            if last - first <= 16:
+                for i in range(first, last):
+                    row = reach[targets[i]]
+                    combine(row, reach[sources[i]], out=row)
+                continue
+            level_source = c_source[first:last]
+            level_target = c_target[first:last]
+            # edges into the same component are contiguous
+            group_starts = numpy.flatnonzero(numpy.diff(level_target, prepend=-1))
+            group_targets = level_target[group_starts]
+            incoming = combine.reduceat(reach[level_source], group_starts, axis=0)
+            reach[group_targets] = combine(reach[group_targets], incoming)
+
+        if exact:
+            bytes_ = reach.astype('<u8', copy=False).view(numpy.uint8)
+            counts = numpy.empty(count, dtype=numpy.int64)
+            for start in range(0, count, 256):
+                bits = numpy.unpackbits(bytes_[start:start + 256], axis=1, bitorder='little')
+                counts[start:start + 256] = bits[:, :count] @ sizes
+            estimated = numpy.zeros(count, dtype=bool)
+        else:
+            counts = numpy.rint((self.estimate_rounds - 1) /
+                                reach.sum(axis=1, dtype=numpy.float64))
+            # at least its own component, at most every node
+            counts = numpy.clip(counts, sizes, n).astype(numpy.int64)
+            estimated = levels > 0
+            counts[~estimated] = sizes[~estimated]
+
+        fan_in = numpy.maximum(counts[component_of] - 1, 0)
+        return fan_in, estimated[component_of]
@@ -1,5 +1,6 @@
 
 from import_identifiers import ImportIdentifier_R
+from FileLimits import FileLimits, FileLimitError, read_blocks
 
 import sys
 import os
@@ -18,9 +19,10 @@ class ImportManager:
                 return True
         return False
 
-    def add_auto_imports(self, docnodes):
+    def add_auto_imports(self, docnodes, limits=None):
         '''
             Docnodes: list of docnode objects
+            limits: FileLimits to read files with (see read_imports)
         '''
         docnode_filepath_map = {node.filepath.lower() : node for node in docnodes}
         for node in docnodes:
@@ -34,11 +36,13 @@ class ImportManager:
                         # we know we can read this file since it's
                         # in the list of docnodes and it's already
                         # been parsed to grab annotations
-                        with open(node.filepath, 'r') as f:
-                            text = f.read()
+                        imports = self.read_imports(identifier, node.filepath, limits)
+                        if imports is None:
+                            sys.stderr.write("Skipped auto imports of {}: it breaks the file limits\n"
+                                             .format(node.filepath))
+                            imports = set()
 
                         dirname = os.path.dirname(node.filepath)
-                        imports = identifier.get_imports(text)
 
                         # get the full path
                         import_paths = [os.path.join(dirname, i) for i in imports]
@@ -62,3 +66,20 @@ class ImportManager:
 
                 # drop the AUTO edge
                 node.edges.remove({'id': 'AUTO', 'type': 'import'})
+
+    def read_imports(self, identifier, filepath, limits=None):
+        '''
+            returns the imports identifier finds in filepath, handing it the
+            file a block of whole lines at a time (see read_blocks) under
+            the limits the file was parsed with. Returns None if the file
+            breaks them. Undecodable bytes (which an mmap scan lets through
+            outside annotations) are replaced, not fatal
+        '''
+        limits = limits if limits is not None else FileLimits()
+        imports = set()
+        try:
+            for text in read_blocks(filepath, limits, errors='replace'):
+                imports |= set(identifier.get_imports(text))
+        except FileLimitError:
+            return None
+        return imports
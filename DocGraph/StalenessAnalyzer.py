@@ -0,0 +1,107 @@
+
+from graph_utils import strongly_connected_components
+
+
+class StalenessAnalyzer:
+    '''
+        Finds files that import or fork something that changed after they
+        were last modified, directly or further up the chain (the Bob and
+        Rob problem). One pass over the strongly connected components of
+        the graph (see strongly_connected_components), upstreams first, so
+        it runs in time linear in nodes plus edges; files in an import
+        cycle all see each other's changes.
+
+        For every node:
+        - stale: some upstream file is newer than this one
+        - stale_count: how many of its direct upstreams are newer than it,
+          or lead to a file that is
+        - stale_depth: the number of stale files on the longest chain of
+          stale files ending at this one (1 if none of its upstreams are
+          stale themselves), 0 if it isn't stale
+
+        Files without an mtime (they couldn't be stat-ed) are never stale
+        and never make anything else stale.
+    '''
+
+    EDGE_TYPES = ['import', 'fork']
+
+    def __init__(self, edge_types=None):
+        self.edge_types = set(edge_types if edge_types is not None else self.EDGE_TYPES)
+
+    def compute(self, docnodes):
+        '''
+            returns {name: {'stale', 'stale_count', 'stale_depth'}}
+            for every docnode
+        '''
+        docnodes = list(docnodes)
+        index = {node.name: i for i, node in enumerate(docnodes)}
+        mtimes = [node.mtime for node in docnodes]
+        upstreams = [[index[e['id']] for e in node.edges
+                      if e['type'] in self.edge_types and e['id'] in index]
+                     for node in docnodes]
+
+        starts = [0]
+        for u in upstreams:
+            starts.append(starts[-1] + len(u))
+        component_of, count = strongly_connected_components(
+            starts, [u for node_upstreams in upstreams for u in node_upstreams])
+        components = [[] for c in range(count)]
+        for v, c in enumerate(component_of):
+            components[c].append(v)
+
+        # newest mtime among everything upstream of a component (None if nothing)
+        newest = [None] * len(components)
+        depth = [0] * len(components)
+        # reach[i]: the newest mtime that node i itself or its upstreams carry
+        reach = [None] * len(docnodes)
+
+        results = {}
+        for c, members in enumerate(components):
+            for v in members:
+                for u in upstreams[v]:
+                    newest[c] = _newer(newest[c], mtimes[u])
+                    if component_of[u] != c:
+                        newest[c] = _newer(newest[c], newest[component_of[u]])
+            for v in members:
+                reach[v] = _newer(mtimes[v], newest[c])
+
+            for v in members:
+                stale = _is_newer(newest[c], mtimes[v])
+                stale_count = 0
+                stale_depth = 0
+                if stale:
+                    stale_count = sum(1 for u in upstreams[v]
+                                      if _is_newer(reach[u], mtimes[v]))
+                    stale_depth = 1 + max([depth[component_of[u]] for u in upstreams[v]
+                                           if component_of[u] != c] or [0])
+                    depth[c] = max(depth[c], stale_depth)
+                results[docnodes[v].name] = {'stale': stale,
+                                             'stale_count': stale_count,
+                                             'stale_depth': stale_depth}
+        return results
+
+    def apply(self, docnodes):
+        '''
+            computes staleness and adds it to each docnode's graph attributes
+            (.metrics); returns the names of the stale docnodes
+        '''
+        docnodes = list(docnodes)
+        results = self.compute(docnodes)
+        stale = []
+        for docnode in docnodes:
+            docnode.metrics.update(results[docnode.name])
+            if results[docnode.name]['stale']:
+                stale.append(docnode.name)
+        return stale
+
+
+def _newer(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def _is_newer(a, b):
+    return a is not None and b is not None and a > b
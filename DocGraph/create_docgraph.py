@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
 
 from ImportManager import ImportManager
+from CrawlCheckpoint import CrawlCheckpoint, CheckpointMismatchError
+from StalenessAnalyzer import StalenessAnalyzer
+from FileLimits import FileLimits, FileLimitError, check_file, check_seconds, read_blocks
 
 import sys
 import re
 import copy
 import json
 import os
+import mmap
+import codecs
+import locale
+import time
 import random
 import datetime
 import colorsys
 import collections
+import argparse
+import bisect
 
 # from pprint import pprint
 
@@ -21,10 +30,11 @@ class DocNode:
     EDGE_TYPE_IMPORT = 'import'
     EDGE_TYPE_FORK = 'fork'
     EDGE_TYPE_USE = 'use'
+    EDGE_TYPE_SUGGESTED_FORK = 'suggested_fork'  # found by ForkDetector, not annotated
 
     EDGE_TYPES = [EDGE_TYPE_PARENT, EDGE_TYPE_SIBLING,
                   EDGE_TYPE_IMPORT, EDGE_TYPE_FORK,
-                  EDGE_TYPE_USE]
+                  EDGE_TYPE_USE, EDGE_TYPE_SUGGESTED_FORK]
 
     def __init__(self, name, filepath, notes=None):
         self.name = name  # name is unique
@@ -35,22 +45,28 @@ class DocNode:
 
         try:
             statbuf = os.stat(self.filepath)
+            self.mtime = statbuf.st_mtime  # for comparing; last_modified is for display
             date = datetime.datetime.fromtimestamp(statbuf.st_mtime)
             self.last_modified = date.strftime('%b %d, %Y @ %H:%M')
         except:
+            self.mtime = None
             self.last_modified = "Error: can't find file"
 
         self.color = None  # this is used for graphing
+        self.size = None  # graphing too; None leaves the node config's size
+        self.metrics = {}  # extra graph attributes (see GraphMetrics)
         self.seen = False  # this is used when assigning colors (before they've been assigned a color)
 
         # for when we're assigning colors, we need to keep track of all edges into and out of this node
         self.all_connections = set()
 
-    def add_edge(self, identifier, eType):
+    def add_edge(self, identifier, eType, **attributes):
         if eType not in self.EDGE_TYPES:
             raise Exception("edge type is invalid (type: {}, id: {}"
                             .format(eType, identifier))
-        self.edges.append({'id' : identifier, 'type': eType})
+        edge = {'id' : identifier, 'type': eType}
+        edge.update(attributes)  # extra graph attributes, e.g. similarity
+        self.edges.append(edge)
 
     def graph_node(self, config={}):
         node = copy.copy(config)
@@ -59,10 +75,13 @@ class DocNode:
 
         if self.color:
             node["color"] = self.color
+        if self.size is not None:
+            node["size"] = self.size
 
         node["filepath"] = self.filepath
         node["last_modified"] = self.last_modified
         node["notes"] = self.notes if self.notes is not None else "No Notes"
+        node.update(self.metrics)
 
         return node
 
@@ -75,51 +94,296 @@ class DocNode:
             graph_edge['target'] = self.name
 
             graph_edge['semantic_type'] = edge['type']
+            for key, value in edge.items():
+                if key not in ('id', 'type'):
+                    graph_edge[key] = value
 
             graph_edges.append(graph_edge)
 
         return graph_edges
 
+    def state(self):
+        '''
+            json-friendly copy of everything parsed from the file
+            (see docnode_from_state)
+        '''
+        return {'name': self.name,
+                'filepath': self.filepath,
+                'notes': self.notes,
+                'last_modified': self.last_modified,
+                'mtime': self.mtime,
+                'edges': self.edges}
+
+
+def docnode_from_state(state):
+    docnode = DocNode(state['name'], state['filepath'], state['notes'])
+    docnode.last_modified = state['last_modified']
+    docnode.mtime = state['mtime']
+    docnode.edges = [dict(edge) for edge in state['edges']]
+    return docnode
+
+
+# annotations are matched one line at a time (.* never crosses a newline),
+# keeping the first match of each in the file
+ANNOTATION_REGEXES = collections.OrderedDict([
+    ('name', re.compile("@name:(.*)\n")),
+    # ('parents', re.compile("@parent[s]?:(.*)\n")),
+    # ('siblings', re.compile("@sibling[s]?:(.*)\n")),
+    ('notes', re.compile("@note[s]?:(.*)\n")),
+    ('imports', re.compile("@import[s]?:(.*)\n")),
+    ('forks', re.compile("@fork[s]?:(.*)\n")),
+    ('uses', re.compile("@use[s]?:(.*)\n")),
+])
+
+# the same annotations as a single bytes pattern, for scanning a file
+# mapping. Only the key is matched; scan_mmap finds the end of the value
+# itself, with a bounded search, so a file without newlines can't make
+# every match scan to the end of the file
+ANNOTATION_BYTES_REGEX = re.compile(b"@(name|notes?|imports?|forks?|uses?):")
+ANNOTATION_BYTES_KEYS = {b'name': 'name',
+                         b'note': 'notes', b'notes': 'notes',
+                         b'import': 'imports', b'imports': 'imports',
+                         b'fork': 'forks', b'forks': 'forks',
+                         b'use': 'uses', b'uses': 'uses'}
+
+# scan_lines reads in text mode, where \r\n and a lone \r end lines too
+LINE_END_BYTES_REGEX = re.compile(b"[\r\n]")
+
+# scan_mmap works through a mapping this many bytes at a time, checking
+# the clock between blocks
+SCAN_BLOCK_SIZE = 1024 * 1024
+
+SCAN_MODE_LINES = 'lines'
+SCAN_MODE_MMAP = 'mmap'
+SCAN_MODE_MMAP_STRICT = 'mmap-strict'
+SCAN_MODES = [SCAN_MODE_LINES, SCAN_MODE_MMAP, SCAN_MODE_MMAP_STRICT]
+
+
+def scan_lines(filepath, limits):
+    '''
+        returns {annotation: matched text (or None)}, reading the file a
+        block of lines at a time (see read_blocks) so memory is bounded by
+        limits.max_line_length. Returns None if the file can't be decoded
+    '''
+    results = collections.OrderedDict((key, None) for key in ANNOTATION_REGEXES)
+    unmatched = list(ANNOTATION_REGEXES.items())
+
+    try:
+        # read to the end even once everything's matched: the whole file
+        # has to be within limits and decodable
+        for text in read_blocks(filepath, limits):
+            if len(unmatched) == 0 or '@' not in text or not text.endswith('\n'):
+                # ANNOTATION_REGEXES need a line ending, and trying them
+                # on a huge last line without one takes quadratic time
+                continue
+            for key, regex in list(unmatched):
+                result = regex.search(text)
+                if result is not None:
+                    results[key] = result.group(1)
+                    unmatched.remove((key, regex))
+    except UnicodeDecodeError:
+        # if we can't read file, can't produce docnode
+        return None
+
+    return results
+
+
+def scan_mmap(filepath, limits, decode_all=False):
+    '''
+        same as scan_lines, but memory-maps the file and scans it a block
+        at a time with bytes patterns, so the file is never copied into
+        python memory. \r\n and \r end lines, and lines are limited to
+        limits.max_line_length characters, as with scan_lines.
+
+        Only annotation values are decoded, so undecodable bytes elsewhere
+        in the file are ignored. With decode_all (SCAN_MODE_MMAP_STRICT),
+        every block is decoded too, and a file gets exactly the annotations
+        (or None) it gets from scan_lines, except that for a file that both
+        breaks a limit and can't be decoded, the two scans may disagree on
+        which of the two they report
+    '''
+    statbuf = check_file(filepath, limits)
+
+    results = collections.OrderedDict((key, None) for key in ANNOTATION_REGEXES)
+    if statbuf.st_size == 0:
+        # can't map an empty file
+        return results
+    unmatched = set(results)
+    encoding = locale.getpreferredencoding(False)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    # where the first line not yet checked against max_line_length starts
+    line_start = 0
+    started = time.monotonic()
+
+    with open(filepath, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+        if hasattr(mapping, 'madvise'):
+            # read ahead, and let the kernel drop pages we've scanned past
+            mapping.madvise(mmap.MADV_SEQUENTIAL)
+        size = len(mapping)
+        if limits.max_bytes is not None and size > limits.max_bytes:
+            # the file grew since we checked its size
+            raise FileLimitError(filepath, 'read more than {} bytes'
+                                 .format(limits.max_bytes))
 
-def parse_docfile(filepath):
-    text = None
-    with open(filepath, 'r') as f:
         try:
-            text = f.read()
+            for start in range(0, size, SCAN_BLOCK_SIZE):
+                end = min(start + SCAN_BLOCK_SIZE, size)
+                check_seconds(filepath, limits, started)
+
+                if decode_all:
+                    # scan_lines decodes every line, annotated or not
+                    decoder.decode(mapping[start:end], end == size)
+                if limits.max_line_length is not None:
+                    line_start = check_line_lengths(filepath, mapping, line_start, end,
+                                                    limits.max_line_length, encoding)
+                if len(unmatched) == 0:
+                    continue
+
+                # a match starting in this block may run a few bytes into the next
+                for result in ANNOTATION_BYTES_REGEX.finditer(mapping, start, min(end + 16, size)):
+                    if result.start() >= end:
+                        break
+                    check_seconds(filepath, limits, started)
+
+                    key = ANNOTATION_BYTES_KEYS[result.group(1)]
+                    if key not in unmatched:
+                        continue
+
+                    value_start = result.end()
+                    value_end = find_line_end(mapping, value_start, limits.max_line_length)
+                    if value_end is None:
+                        # the last line has no line ending, which
+                        # ANNOTATION_REGEXES need; neither do later matches
+                        break
+                    results[key] = mapping[value_start:value_end].decode(encoding)
+                    unmatched.remove(key)
         except UnicodeDecodeError:
             # if we can't read file, can't produce docnode
             return None
 
-    nameResult = re.search("@name:(.*)\n", text)
-    # parentResult = re.search("@parent[s]?:(.*)\n", text)
-    # siblingResult = re.search("@sibling[s]?:(.*)\n", text)
-    notesResult = re.search("@note[s]?:(.*)\n", text)
-    importResult = re.search("@import[s]?:(.*)\n", text)
-    forkResult = re.search("@fork[s]?:(.*)\n", text)
-    useResult = re.search("@use[s]?:(.*)\n", text)
+    return results
+
+
+def check_line_lengths(filepath, mapping, line_start, end, max_line_length, encoding):
+    '''
+        raises FileLimitError if a line starting between line_start (the
+        start of a line) and end is longer than max_line_length characters.
+        Lines are measured in bytes, jumping from each line start to the
+        last line ending within max_line_length + 1 bytes of it; only a
+        line that's too long in bytes has its characters counted. Returns
+        the start of the next line to check
+    '''
+    size = len(mapping)
+    while line_start < end and size - line_start > max_line_length:
+        window_end = line_start + max_line_length + 1
+        line_end = max(mapping.rfind(b'\n', line_start, window_end),
+                       mapping.rfind(b'\r', line_start, window_end))
+        if line_end < 0:
+            # too many bytes, but maybe not too many characters
+            length, line_end = line_length(mapping, line_start, max_line_length, encoding)
+            if length > max_line_length:
+                raise FileLimitError(filepath, 'line longer than {} characters'
+                                     .format(max_line_length))
+            if line_end is None:
+                # the last line
+                return size
+        line_start = line_end + 1
+    return line_start
+
+
+def line_length(mapping, start, max_line_length, encoding):
+    '''
+        returns (the length in characters of the line starting at start,
+        counting no further than max_line_length + 1, and the position of
+        its line ending or None if there isn't one). Undecodable bytes
+        count as a character each
+    '''
+    decoder = codecs.getincrementaldecoder(encoding)('replace')
+    length = 0
+    line_end = None
+    while start < len(mapping):
+        stop = min(len(mapping), start + SCAN_BLOCK_SIZE)
+        result = LINE_END_BYTES_REGEX.search(mapping, start, stop)
+        if result is not None:
+            line_end = stop = result.start()
+        length += len(decoder.decode(mapping[start:stop], line_end is not None))
+        if length > max_line_length or line_end is not None:
+            break
+        start = stop
+    return length, line_end
+
+
+def find_line_end(mapping, start, max_line_length):
+    '''
+        the position of the end of the line that start is in, or None if
+        it's the last line and has no line ending
+    '''
+    if max_line_length is not None:
+        line_end = LINE_END_BYTES_REGEX.search(
+            mapping, start, min(len(mapping), start + max_line_length + 1))
+        if line_end is not None:
+            return line_end.start()
+    # no longer than max_line_length characters (check_line_lengths has
+    # seen it), but could be longer in bytes
+    line_end = LINE_END_BYTES_REGEX.search(mapping, start)
+    return line_end.start() if line_end is not None else None
+
+
+def parse_docfile(filepath, limits=None, scan_mode=SCAN_MODE_LINES):
+    '''
+        returns a DocNode for an annotated file, None if it isn't annotated.
+        Raises FileLimitError if the file breaks limits (see FileLimits).
+
+        scan_mode picks how the file is read: SCAN_MODE_LINES streams it a
+        block of lines at a time, SCAN_MODE_MMAP scans a memory mapping of
+        the whole file (faster, flat memory use for very large files) and
+        SCAN_MODE_MMAP_STRICT does too, but also rejects files that don't
+        decode as a whole, the way SCAN_MODE_LINES does (see scan_mmap)
+    '''
+    if limits is None:
+        limits = FileLimits()
+
+    if scan_mode in (SCAN_MODE_MMAP, SCAN_MODE_MMAP_STRICT):
+        results = scan_mmap(filepath, limits, scan_mode == SCAN_MODE_MMAP_STRICT)
+    elif scan_mode == SCAN_MODE_LINES:
+        results = scan_lines(filepath, limits)
+    else:
+        raise Exception("scan mode is invalid (mode: {})".format(scan_mode))
+    if results is None:
+        return None
+    return docnode_from_annotations(filepath, results)
+
+
+def docnode_from_annotations(filepath, results):
+    nameResult = results['name']
+    notesResult = results['notes']
+    importResult = results['imports']
+    forkResult = results['forks']
+    useResult = results['uses']
 
     if nameResult is None:
         return None
-    name = nameResult.group(1).strip()
+    name = nameResult.strip()
     if len(name) == 0:
         return None
 
     def get_list_from_result(result):
         l = []
         if result is not None:
-            l = [r.strip() for r in result.group(1).split(',')]
+            l = [r.strip() for r in result.split(',')]
             l = [r for r in l if len(r) > 0]
         return l
 
-    # parents = get_list_from_result(parentResult)
-    # siblings = get_list_from_result(siblingResult)
+    # parents = get_list_from_result(results['parents'])
+    # siblings = get_list_from_result(results['siblings'])
     imports = get_list_from_result(importResult)
     forks = get_list_from_result(forkResult)
     uses = get_list_from_result(useResult)
 
     notes = None
     if notesResult is not None:
-        notes = notesResult.group(1).strip()
+        notes = notesResult.strip()
         notes = notes if len(notes) > 0 else None
 
     docnode = DocNode(name=name, filepath=filepath, notes=notes)
@@ -215,87 +479,566 @@ class ColorAssigner:
                 unassigned += [node_map[c] for c in node.all_connections]
 
 
+class DocGraph:
+    '''
+        Library entry point: the crawl -> graph pipeline as a chain of
+        generator stages. Every stage takes an iterable of docnodes and
+        yields docnodes, so callers can mix in their own stages or sinks.
+        Stages that need to see the whole graph (dedup, auto imports,
+        validation, coloring) buffer internally. An instance keeps its
+        ImportManager (and its compiled identifiers) between runs.
+
+        limits (a FileLimits) is applied to every parsed file; files that
+        break it are skipped and listed in self.skipped_files.
+
+        With metrics=True, nodes() runs the analyze stage after validation
+        (needs numpy). graph() adds neighbor lists to every node, plus
+        upstream lists when upstream_depth > 0 (see add_neighbor_lists).
+
+        nodes() also runs the (linear time) staleness stage, marking files
+        that import or fork something modified after them.
+
+        Given a ForkDetector, every parsed file is also signed, and nodes()
+        runs the suggest_forks stage before coloring (needs numpy).
+    '''
+
+    NODE_CONFIG = {'size': 10}
+    EDGE_CONFIG = {'size': 3}
+
+    def __init__(self, import_manager=None, limits=None,
+                 scan_mode=SCAN_MODE_LINES, metrics=False, upstream_depth=0,
+                 fork_detector=None):
+        if import_manager is None:
+            import_manager = ImportManager()
+        self.import_manager = import_manager
+        self.limits = limits if limits is not None else FileLimits()
+        self.scan_mode = scan_mode
+        self.metrics = metrics
+        self.upstream_depth = upstream_depth
+        self.fork_detector = fork_detector
+
+        # stats from the most recent run of the matching stage
+        self.filecount = 0
+        self.skipped_files = []
+        self.rejected_edges = []
+        self.suggested_forks = []
+        self.stale_nodes = []
+
+    def iter_files(self, directories):
+        '''
+            yields the path of every file in directories, recursively on down
+        '''
+        self.filecount = 0
+        for directory in directories:
+            for root, dirs, files in os.walk(directory):
+                for fname in files:
+                    self.filecount += 1
+                    yield os.path.join(root, fname)
+
+    def parse_nodes(self, paths):
+        '''
+            yields a docnode for every annotated file in paths
+        '''
+        self.skipped_files = []
+        if self.fork_detector is not None:
+            self.fork_detector.start()
+        for path in paths:
+            docnode = self.parse_file(path)
+            if docnode is not None:
+                yield docnode
+
+    def parse_file(self, path):
+        try:
+            docnode = parse_docfile(path, self.limits, self.scan_mode)
+        except FileLimitError as e:
+            self.skipped_files.append((e.filepath, e.reason))
+            return None
+        # sign it now, while the file is still in the page cache
+        if docnode is not None and self.fork_detector is not None:
+            self.fork_detector.add(path, self.limits)
+        return docnode
+
+    def crawl(self, directories, checkpoint=None, resume=False):
+        '''
+            iter_files + parse_nodes, one directory at a time. If given a
+            CrawlCheckpoint, every finished directory is recorded in it, and
+            with resume=True directories finished by an earlier (interrupted)
+            crawl are replayed from it instead of parsed again
+        '''
+        self.filecount = 0
+        self.skipped_files = []
+        if self.fork_detector is not None:
+            self.fork_detector.start()
+
+        completed = set()
+        if checkpoint is not None:
+            header = {'directories': list(directories),
+                      'limits': vars(self.limits),
+                      'scan_mode': self.scan_mode}
+            records = checkpoint.resume(header) if resume else []
+            if not resume:
+                checkpoint.start(header)
+
+            # records are in walk order, so replaying them first keeps the
+            # node order the same as an uninterrupted crawl
+            for record in records:
+                completed.add((record['directory'], record['root']))
+                self.filecount += record['filecount']
+                self.skipped_files += [tuple(s) for s in record['skipped']]
+                for state in record['nodes']:
+                    docnode = docnode_from_state(state)
+                    if self.fork_detector is not None:
+                        self.fork_detector.add(docnode.filepath, self.limits)
+                    yield docnode
+
+        for index, directory in enumerate(directories):
+            for root, dirs, files in os.walk(directory):
+                if (index, root) in completed:
+                    continue
+
+                skipped_count = len(self.skipped_files)
+                docnodes = []
+                for fname in files:
+                    self.filecount += 1
+                    docnode = self.parse_file(os.path.join(root, fname))
+                    if docnode is not None:
+                        docnodes.append(docnode)
+
+                if checkpoint is not None:
+                    checkpoint.record({
+                        'directory': index,
+                        'root': root,
+                        'filecount': len(files),
+                        'skipped': self.skipped_files[skipped_count:],
+                        'nodes': [n.state() for n in docnodes]})
+                yield from docnodes
+
+        if checkpoint is not None:
+            checkpoint.close()
+
+    def unique_nodes(self, docnodes):
+        '''
+            names are unique: a later docnode replaces an earlier one
+            with the same name, but keeps the earlier one's position
+        '''
+        node_map = collections.OrderedDict()
+        for docnode in docnodes:
+            node_map[docnode.name] = docnode
+        yield from node_map.values()
+
+    def resolve_auto_imports(self, docnodes):
+        '''
+            replaces AUTO imports with edges found by the import manager
+        '''
+        docnodes = list(docnodes)
+        self.import_manager.add_auto_imports(docnodes, self.limits)
+        yield from docnodes
+
+    def validate(self, docnodes):
+        '''
+            drops edges to names that don't exist, keeping them in
+            self.rejected_edges
+        '''
+        node_map = collections.OrderedDict((n.name, n) for n in docnodes)
+        self.rejected_edges = []
+        for docnode in node_map.values():
+            verified_edges = []
+            for edge in docnode.edges:
+                if edge['id'] in node_map:
+                    verified_edges.append(edge)
+                else:
+                    self.rejected_edges.append(edge)
+            docnode.edges = verified_edges
+        yield from node_map.values()
+
+    def analyze(self, docnodes):
+        '''
+            adds degree, fan in/out and pagerank attributes to each node,
+            and sizes nodes by pagerank (see GraphMetrics). Needs numpy
+        '''
+        from GraphMetrics import GraphMetrics
+        docnodes = list(docnodes)
+        GraphMetrics(DocNode.EDGE_TYPES).apply(docnodes)
+        yield from docnodes
+
+    def staleness(self, docnodes):
+        '''
+            adds stale, stale_count and stale_depth attributes to each node
+            (see StalenessAnalyzer). Stale nodes are listed in self.stale_nodes
+        '''
+        docnodes = list(docnodes)
+        self.stale_nodes = StalenessAnalyzer().apply(docnodes)
+        yield from docnodes
+
+    def suggest_forks(self, docnodes):
+        '''
+            adds a suggested_fork edge (with its estimated similarity) from
+            each older file to every newer near-duplicate of it that isn't
+            already linked to it by an @forks annotation (see ForkDetector).
+            Suggestions are listed in self.suggested_forks
+        '''
+        docnodes = list(docnodes)
+        self.suggested_forks = []
+
+        forks = set()
+        for node in docnodes:
+            for edge in node.edges:
+                if edge['type'] == DocNode.EDGE_TYPE_FORK:
+                    forks.add((edge['id'], node.name))
+                    forks.add((node.name, edge['id']))
+
+        for older, newer, similarity in self.fork_detector.suggestions(docnodes):
+            if (older.name, newer.name) in forks:
+                continue
+            similarity = round(similarity, 3)
+            newer.add_edge(older.name, DocNode.EDGE_TYPE_SUGGESTED_FORK,
+                           similarity=similarity)
+            self.suggested_forks.append((older.name, newer.name, similarity))
+
+        if self.fork_detector.cache_path is not None:
+            self.fork_detector.save_cache()
+        yield from docnodes
+
+    def color(self, docnodes):
+        '''
+            assigns one color per connected subgraph (see ColorAssigner)
+        '''
+        node_map = collections.OrderedDict((n.name, n) for n in docnodes)
+
+        ## we do this as follows:
+        #### climb up chain of parents
+        #### if parent has color assigned, assign same color to all children
+        #### if we reach the top of the chain without having assigned a color, assign a color and bubble down
+        #### IMPORTANT: remember to mark nodes as "seen" as we do this!
+        ####            (because we don't necessary want to force links as a tree structure)
+        ColorAssigner().assign_colors(node_map)
+        yield from node_map.values()
+
+    def by_component(self, docnodes):
+        '''
+            reorders docnodes so each connected subgraph is contiguous,
+            largest first (ties keep their original order, as do nodes
+            within a subgraph). Run before graph() when writing chunks
+        '''
+        node_map = collections.OrderedDict((n.name, n) for n in docnodes)
+
+        connections = {name: [] for name in node_map}
+        for name, node in node_map.items():
+            for edge in node.edges:
+                connections[name].append(edge['id'])
+                connections[edge['id']].append(name)
+
+        components = []
+        component_of = {}
+        for name in node_map:
+            if name in component_of:
+                continue
+            component = len(components)
+            component_of[name] = component
+            unvisited = [name]
+            size = 0
+            while len(unvisited) > 0:
+                size += 1
+                for other in connections[unvisited.pop()]:
+                    if other not in component_of:
+                        component_of[other] = component
+                        unvisited.append(other)
+            components.append(size)
+
+        yield from sorted(node_map.values(),
+                          key=lambda n: (-components[component_of[n.name]],
+                                         component_of[n.name]))
+
+    def serialize(self, docnodes, node_config=None, edge_config=None):
+        '''
+            yields a (graph node, list of graph edges) pair per docnode,
+            in the format read by doc_grapher.html
+        '''
+        node_config = self.NODE_CONFIG if node_config is None else node_config
+        edge_config = self.EDGE_CONFIG if edge_config is None else edge_config
+        for docnode in docnodes:
+            yield docnode.graph_node(node_config), docnode.graph_edges(edge_config)
+
+    def nodes(self, directories, checkpoint=None, resume=False):
+        '''
+            runs every stage up to (and including) coloring
+        '''
+        docnodes = self.crawl(directories, checkpoint, resume)
+        docnodes = self.unique_nodes(docnodes)
+        docnodes = self.resolve_auto_imports(docnodes)
+        docnodes = self.validate(docnodes)
+        if self.metrics:
+            docnodes = self.analyze(docnodes)
+        docnodes = self.staleness(docnodes)
+        if self.fork_detector is not None:
+            docnodes = self.suggest_forks(docnodes)
+        return self.color(docnodes)
+
+    def graph(self, docnodes):
+        '''
+            collects serialized docnodes into a {'nodes': [], 'edges': []} dict
+        '''
+        nodes = []
+        edges = []
+        for node, node_edges in self.serialize(docnodes):
+            nodes.append(node)
+            edges += node_edges
+        graph = {'nodes': nodes, 'edges': edges}
+        add_neighbor_lists(graph, self.upstream_depth)
+        return graph
+
+    def write_json(self, graph, outfname):
+        # compact: indenting puts every neighbor/edge index on its own line
+        with open(outfname, 'w') as f:
+            json.dump(graph, f, separators=(',', ':'))
+
+    def write_chunks(self, graph, outfname, chunk_size):
+        '''
+            writes graph as numbered chunk files of about chunk_size nodes
+            each (a connected subgraph is never split), plus a manifest at
+            outfname listing them, which doc_grapher.html loads one at a
+            time. Node and edge indices (see add_neighbor_lists) carry over
+            to the concatenation of the chunks, so graph has to be ordered
+            by component (see by_component)
+        '''
+        nodes = graph['nodes']
+        edges = graph['edges']
+        index = {node['id']: i for i, node in enumerate(nodes)}
+
+        # the last node of each subgraph, so we only cut between subgraphs
+        last_index = list(range(len(nodes)))
+        parent = list(range(len(nodes)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for edge in edges:
+            source = find(index[edge['source']])
+            target = find(index[edge['target']])
+            if source != target:
+                parent[source] = target
+                last_index[target] = max(last_index[target], last_index[source])
+
+        cuts = []
+        reach = -1
+        start = 0
+        for i in range(len(nodes)):
+            reach = max(reach, last_index[find(i)])
+            if reach == i and (i + 1 - start >= chunk_size or i + 1 == len(nodes)):
+                cuts.append(i + 1)
+                start = i + 1
+
+        # an edge goes in the chunk of its later node, so both its nodes
+        # are in the graph by the time it's added
+        chunk_edges = [[] for cut in cuts]
+        chunk = 0
+        for edge in edges:
+            later = max(index[edge['source']], index[edge['target']])
+            if later >= cuts[chunk]:
+                chunk = bisect.bisect_right(cuts, later)
+            elif chunk > 0 and later < cuts[chunk - 1]:
+                raise Exception("graph isn't ordered by component (edge: {})"
+                                .format(edge['id']))
+            chunk_edges[chunk].append(edge)
+
+        root, ext = os.path.splitext(outfname)
+        chunk_fnames = []
+        start = 0
+        for chunk, cut in enumerate(cuts):
+            chunk_fname = '{}.{}{}'.format(root, chunk, ext)
+            with open(chunk_fname, 'w') as f:
+                json.dump({'nodes': nodes[start:cut], 'edges': chunk_edges[chunk]}, f,
+                          separators=(',', ':'))
+            chunk_fnames.append(os.path.basename(chunk_fname))
+            start = cut
+
+        manifest = {'node_count': len(nodes),
+                    'edge_count': len(edges),
+                    'chunks': chunk_fnames}
+        with open(outfname, 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+    def write_columnar(self, docnodes, dirname):
+        '''
+            writes docnodes as memory-mappable numpy columns (see
+            ColumnarExporter). Needs numpy
+        '''
+        from ColumnarExporter import ColumnarExporter
+        ColumnarExporter(DocNode.EDGE_TYPES).write(docnodes, dirname)
+
+
+def add_neighbor_lists(graph, upstream_depth=0):
+    '''
+        gives every node of a graph dict the indices (into graph['nodes'] and
+        graph['edges']) of its neighbors and incident edges, so the viewer
+        can update a clicked node's surroundings without walking the whole
+        graph. With upstream_depth > 0, nodes also get the indices of the
+        nodes they import/fork/use, up to that many edges away
+    '''
+    nodes = graph['nodes']
+    index = {node['id']: i for i, node in enumerate(nodes)}
+
+    neighbors = [set() for node in nodes]
+    incident_edges = [[] for node in nodes]
+    upstream = [[] for node in nodes]
+    for i, edge in enumerate(graph['edges']):
+        source = index[edge['source']]
+        target = index[edge['target']]
+        neighbors[source].add(target)
+        neighbors[target].add(source)
+        incident_edges[source].append(i)
+        if target != source:
+            incident_edges[target].append(i)
+        upstream[target].append(source)
+
+    for i, node in enumerate(nodes):
+        neighbors[i].discard(i)
+        node['neighbors'] = sorted(neighbors[i])
+        node['incident_edges'] = incident_edges[i]
+
+    if upstream_depth > 0:
+        for i, node in enumerate(nodes):
+            # breadth first, one level per depth
+            seen = {i}
+            level = [i]
+            for depth in range(upstream_depth):
+                next_level = []
+                for n in level:
+                    for u in upstream[n]:
+                        if u not in seen:
+                            seen.add(u)
+                            next_level.append(u)
+                level = next_level
+            seen.discard(i)
+            node['upstream'] = sorted(seen)
+
+
 def main(args):
-    if len(args) < 3:
-        sys.stderr.write("usage: {} <directories> <output.json>\n".format(args[0]))
-        sys.stderr.write("\t<directories>: list of space-separated directories to examine\n")
-        sys.stderr.write("\t<output>: json file describing graphs, interpreted by doc_grapher.html\n")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(prog=args[0])
+    parser.add_argument('directories', nargs='+',
+                        help='list of space-separated directories to examine')
+    parser.add_argument('output',
+                        help='json file describing graphs, interpreted by doc_grapher.html')
+    parser.add_argument('--max-bytes', type=int, default=None,
+                        help='skip files larger than this many bytes')
+    parser.add_argument('--max-line-length', type=int,
+                        default=FileLimits.DEFAULT_MAX_LINE_LENGTH,
+                        help='skip files with a line longer than this (default: %(default)s)')
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='skip files that take longer than this to parse')
+    parser.add_argument('--scan-mode', choices=SCAN_MODES, default=SCAN_MODE_LINES,
+                        help='read files line by line, or scan a memory map of '
+                             'each whole file (mmap-strict also skips files that '
+                             'don\'t decode as a whole) (default: %(default)s)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='size nodes by pagerank and add degree, fan in/out '
+                             'and pagerank attributes (needs numpy)')
+    parser.add_argument('--upstream-depth', type=int, default=0, metavar='K',
+                        help='also list the nodes each node imports/forks/uses, '
+                             'up to K edges away, for the viewer to highlight')
+    parser.add_argument('--suggest-forks', action='store_true',
+                        help='add suggested_fork edges between near-duplicate files '
+                             'that have no @forks annotation (needs numpy)')
+    parser.add_argument('--fork-cache', default=None, metavar='PATH',
+                        help='file to keep file signatures in between runs '
+                             '(default: <output>.signatures, as PATH.npy and PATH.json)')
+    parser.add_argument('--chunk-size', type=int, default=None, metavar='NODES',
+                        help='write the graph as chunks of about this many nodes, '
+                             'largest subgraph first, for the viewer to load progressively')
+    parser.add_argument('--columnar', default=None, metavar='DIRECTORY',
+                        help='also write the graph as numpy columns to this directory')
+    parser.add_argument('--checkpoint', default=None,
+                        help='file to record crawl progress in (default: <output>.checkpoint)')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted crawl from its checkpoint')
+    options = parser.parse_args(args[1:])
 
-    directories = args[1:-1]
-    outfname = args[-1]
+    directories = options.directories
+    outfname = options.output
+    limits = FileLimits(max_bytes=options.max_bytes,
+                        max_line_length=options.max_line_length,
+                        max_seconds=options.max_seconds)
+    checkpoint = CrawlCheckpoint(options.checkpoint or outfname + '.checkpoint')
+    forkDetector = None
+    if options.suggest_forks:
+        from ForkDetector import ForkDetector
+        forkDetector = ForkDetector(
+            cache_path=options.fork_cache or outfname + '.signatures')
 
     # for each file in each directory, recursively on down,
-    # search for doc annotations and create objects appropriately
-    docnodes = collections.OrderedDict()
-    filecount = 0
-    for directory in directories:
-        for root, dirs, files in os.walk(directory):
-            for fname in files:
-                filecount += 1
-
-                path = os.path.join(root, fname)
-                docnode = parse_docfile(path)
-
-                if docnode is None:
-                    # sys.stderr.write("Error! File is not annotated: {}\n"
-                    #                  .format(path))
-                    continue
-                docnodes[docnode.name] = docnode
-
-    # if any docnodes have auto import set up, take care of that
-    import_manager = ImportManager()
-    import_manager.add_auto_imports(list(docnodes.values()))
-
-    # validate all parents & siblings - make sure they actually exist
-    rejectedEdges = []
-    for name in docnodes:
-        docnode = docnodes[name]
-        verified_edges = []
-        for edge in docnode.edges:
-            if edge['id'] in docnodes:
-                verified_edges.append(edge)
-            else:
-                rejectedEdges.append(edge)
-        docnode.edges = verified_edges
+    # search for doc annotations and create objects appropriately.
+    # along the way, take care of auto imports, validate all edges
+    # (make sure they actually exist) and assign colors to distinct segments
+    docgraph = DocGraph(limits=limits, scan_mode=options.scan_mode,
+                        metrics=options.metrics,
+                        upstream_depth=options.upstream_depth,
+                        fork_detector=forkDetector)
+    docnodes = docgraph.nodes(directories, checkpoint, options.resume)
+    if options.chunk_size is not None:
+        docnodes = docgraph.by_component(docnodes)
+    try:
+        docnodes = list(docnodes)
+    except CheckpointMismatchError as e:
+        parser.error('{} (run without --resume to start over)'.format(e))
+
+    # report files that were too big (or too slow) to parse
+    skippedFiles = docgraph.skipped_files
+    if len(skippedFiles) > 0:
+        print('Skipped {} file{}'.format(
+            len(skippedFiles),
+            's' if len(skippedFiles) != 1 else ''))
+        for path, reason in skippedFiles:
+            print('\t{}: {}'.format(path, reason))
+
     # print any rejected edges
+    rejectedEdges = docgraph.rejected_edges
     print('Rejected {} edge{}'.format(
         len(rejectedEdges),
         's' if len(rejectedEdges) != 1 else ''))
     if len(rejectedEdges) > 0:
         print(rejectedEdges)
 
-    ## assign colors to distinct segments
-    ## we do this as follows:
-    #### climb up chain of parents
-    #### if parent has color assigned, assign same color to all children
-    #### if we reach the top of the chain without having assigned a color, assign a color and bubble down
-    #### IMPORTANT: remember to mark nodes as "seen" as we do this!
-    ####            (because we don't necessary want to force links as a tree structure)
-    assigner = ColorAssigner()
-    assigner.assign_colors(docnodes)
-
-    nodes = []
-    edges = []
-    node_config = {'size': 10}
-    edge_config = {'size': 3}
-    for name in docnodes:
-        docnode = docnodes[name]
-
-        nodes.append(docnode.graph_node(node_config))
-        edges += docnode.graph_edges(edge_config)
+    # report files whose imports/forks changed after they did
+    staleNodes = docgraph.stale_nodes
+    print('Found {} stale file{}'.format(
+        len(staleNodes),
+        's' if len(staleNodes) != 1 else ''))
+    if len(staleNodes) > 0:
+        print(staleNodes)
+
+    if forkDetector is not None:
+        suggestedForks = docgraph.suggested_forks
+        print('Suggested {} fork{} ({} file{} hashed)'.format(
+            len(suggestedForks),
+            's' if len(suggestedForks) != 1 else '',
+            forkDetector.hashed_count,
+            's' if forkDetector.hashed_count != 1 else ''))
+        for older, newer, similarity in suggestedForks:
+            print('\t{} -> {} ({:.0%} similar)'.format(older, newer, similarity))
+
+    graph = docgraph.graph(docnodes)
+    nodes = graph['nodes']
+    edges = graph['edges']
 
     if len(nodes) == 0:
         sys.stderr.write("No annotated files found! Not writing output file.\n")
+        checkpoint.remove()
         sys.exit(1)
 
     print("Extracted {} nodes with {} edges from {} files"
-          .format(len(nodes), len(edges), filecount))
-    graph = {'nodes': nodes, 'edges': edges}
+          .format(len(nodes), len(edges), docgraph.filecount))
     # pprint(graph)
 
-    with open(outfname, 'w') as f:
-        json.dump(graph, f, indent=4)
+    if options.chunk_size is not None:
+        docgraph.write_chunks(graph, outfname, options.chunk_size)
+    else:
+        docgraph.write_json(graph, outfname)
+    if options.columnar is not None:
+        docgraph.write_columnar(docnodes, options.columnar)
+    checkpoint.remove()
 
 
 if __name__ == '__main__':
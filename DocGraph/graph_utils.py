@@ -0,0 +1,88 @@
+
+def strongly_connected_components(starts, targets):
+    '''
+        Tarjan's algorithm without recursion (long chains would overflow
+        python's stack), over a graph in compressed sparse row form: the
+        edges out of node v go to targets[starts[v]:starts[v + 1]] (both
+        lists). Returns (component of each node, number of components),
+        with every component numbered after the components it has edges to
+    '''
+    n = len(starts) - 1
+    order = [-1] * n
+    lowlink = [0] * n
+    on_stack = [False] * n
+    stack = []
+    component_of = [-1] * n
+    count = 0
+    counter = 0
+
+    for root in range(n):
+        if order[root] >= 0:
+            continue
+        order[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        # (node, position of its next edge in targets)
+        work = [(root, starts[root])]
+        while len(work) > 0:
+            v, i = work.pop()
+            end = starts[v + 1]
+            descended = False
+            while i < end:
+                u = targets[i]
+                i += 1
+                if order[u] < 0:
+                    work.append((v, i))
+                    order[u] = lowlink[u] = counter
+                    counter += 1
+                    stack.append(u)
+                    on_stack[u] = True
+                    work.append((u, starts[u]))
+                    descended = True
+                    break
+                if on_stack[u] and order[u] < lowlink[v]:
+                    lowlink[v] = order[u]
+            if descended:
+                continue
+
+            if lowlink[v] == order[v]:
+                while True:
+                    u = stack.pop()
+                    on_stack[u] = False
+                    component_of[u] = count
+                    if u == v:
+                        break
+                count += 1
+            if len(work) > 0:
+                # back in the node we came from
+                parent = work[-1][0]
+                if lowlink[v] < lowlink[parent]:
+                    lowlink[parent] = lowlink[v]
+
+    return component_of, count
+
+
+def edge_arrays(docnodes, edge_types):
+    '''
+        returns (source, target, type) arrays for the edges of docnodes, with
+        nodes numbered by their position in docnodes and types by their
+        position in edge_types
+    '''
+    import numpy
+    index = {node.name: i for i, node in enumerate(docnodes)}
+    type_index = {t: i for i, t in enumerate(edge_types)}
+
+    edge_count = sum(len(node.edges) for node in docnodes)
+    source = numpy.empty(edge_count, dtype=numpy.int32)
+    target = numpy.empty(edge_count, dtype=numpy.int32)
+    etype = numpy.empty(edge_count, dtype=numpy.int8)
+    position = 0
+    for i, node in enumerate(docnodes):
+        count = len(node.edges)
+        source[position:position + count] = [index[e['id']] for e in node.edges]
+        target[position:position + count] = i
+        etype[position:position + count] = [type_index[e['type']] for e in node.edges]
+        position += count
+
+    return source, target, etype
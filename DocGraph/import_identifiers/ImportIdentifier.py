@@ -16,5 +16,9 @@ class ImportIdentifier:
     def get_imports(self, text):
         '''
             return a set() of files that the text imports
+
+            text is a block of whole lines of the file, not necessarily
+            all of it: large files are handed over in several blocks (see
+            ImportManager.read_imports), so an import has to fit in a block
         '''
         pass
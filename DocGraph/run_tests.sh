@@ -1,3 +1,3 @@
 #!/usr/bin/env bash
 
-python3 -m unittest tests.test_{colorization,parsing,import_manager,import_identifiers}
+python3 -m unittest tests.test_{colorization,parsing,import_manager,import_identifiers,docgraph,checkpoint,columnar_exporter,graph_metrics,fork_detector,staleness,equivalence}
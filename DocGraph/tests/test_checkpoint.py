@@ -0,0 +1,106 @@
+
+import unittest
+import shutil
+import os
+import io
+import contextlib
+
+from CrawlCheckpoint import *
+from create_docgraph import *
+
+TEST_DIRECTORY = '/tmp/TEST_CHECKPOINT_TMPDIR'
+CHECKPOINT_PATH = '/tmp/TEST_CHECKPOINT_TMPFILE'
+
+
+class CheckpointTests(unittest.TestCase):
+
+    def setUp(self):
+        for i in range(6):
+            dirname = os.path.join(TEST_DIRECTORY, 'd{}'.format(i))
+            os.makedirs(dirname, exist_ok=True)
+            with open(os.path.join(dirname, 'n{}.py'.format(i)), 'w') as f:
+                f.write('@name: n{}\n'.format(i))
+                f.write('@imports: n{}, missing\n'.format((i + 1) % 6))
+            with open(os.path.join(dirname, 'plain.txt'), 'w') as f:
+                f.write('not annotated\n')
+
+        self.checkpoint = CrawlCheckpoint(CHECKPOINT_PATH)
+
+    def tearDown(self):
+        self.checkpoint.remove()
+        shutil.rmtree(TEST_DIRECTORY, ignore_errors=True)
+
+    def uninterrupted(self):
+        docgraph = DocGraph()
+        graph = docgraph.graph(docgraph.nodes([TEST_DIRECTORY]))
+        return graph, docgraph.filecount, docgraph.rejected_edges
+
+    def test_resume_matchesUninterruptedRun(self):
+        expected = self.uninterrupted()
+
+        # stop the crawl partway through, as if it had been killed
+        crawl = DocGraph().crawl([TEST_DIRECTORY], self.checkpoint)
+        for i in range(3):
+            next(crawl)
+        self.checkpoint.abandon()
+
+        docgraph = DocGraph()
+        nodes = docgraph.nodes([TEST_DIRECTORY], self.checkpoint, resume=True)
+        graph = docgraph.graph(nodes)
+
+        self.assertEqual((graph, docgraph.filecount, docgraph.rejected_edges),
+                         expected)
+
+    def test_resume_dropsTruncatedRecord(self):
+        expected = self.uninterrupted()
+
+        list(DocGraph().crawl([TEST_DIRECTORY], self.checkpoint))
+        with open(CHECKPOINT_PATH, 'a') as f:
+            f.write('{"directory": 0, "root": "/tm')
+
+        docgraph = DocGraph()
+        nodes = docgraph.nodes([TEST_DIRECTORY], self.checkpoint, resume=True)
+
+        self.assertEqual(docgraph.graph(nodes), expected[0])
+
+    def test_resume_noCheckpoint(self):
+        expected = self.uninterrupted()
+
+        docgraph = DocGraph()
+        nodes = docgraph.nodes([TEST_DIRECTORY], self.checkpoint, resume=True)
+
+        self.assertEqual(docgraph.graph(nodes), expected[0])
+        self.assertTrue(os.path.isfile(CHECKPOINT_PATH))
+
+    def test_resume_differentCrawl(self):
+        list(DocGraph().crawl([TEST_DIRECTORY], self.checkpoint))
+
+        crawl = DocGraph().crawl([TEST_DIRECTORY, '/tmp'], self.checkpoint,
+                                 resume=True)
+        with self.assertRaises(CheckpointMismatchError):
+            list(crawl)
+
+    def test_main_noAnnotatedFiles(self):
+        empty = os.path.join(TEST_DIRECTORY, 'empty')
+        os.makedirs(empty)
+        output = os.path.join(TEST_DIRECTORY, 'output.json')
+
+        with self.assertRaises(SystemExit), \
+                contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()):
+            main(['create_docgraph.py', empty, output])
+        self.assertFalse(os.path.exists(output + '.checkpoint'))
+
+    def test_main_resumeDifferentCrawl(self):
+        output = os.path.join(TEST_DIRECTORY, 'output.json')
+        checkpoint = CrawlCheckpoint(output + '.checkpoint')
+        list(DocGraph().crawl(['/tmp/somewhere/else'], checkpoint))
+
+        stderr = io.StringIO()
+        with self.assertRaises(SystemExit) as raised, \
+                contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(stderr):
+            main(['create_docgraph.py', TEST_DIRECTORY, output, '--resume'])
+        # a usage error, not a traceback
+        self.assertEqual(raised.exception.code, 2)
+        self.assertIn('different crawl', stderr.getvalue())
@@ -0,0 +1,68 @@
+
+import unittest
+import shutil
+
+from create_docgraph import *
+
+try:
+    import numpy
+    from ColumnarExporter import *
+except ImportError:
+    numpy = None
+
+TEST_DIRECTORY = '/tmp/TEST_COLUMNAR_TMPDIR'
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ColumnarExporterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.n1 = DocNode('n1', '/n1', notes='first node')
+        self.n2 = DocNode('n2', '/n2')
+        self.n3 = DocNode('n3', '/ünïcode/n3')
+
+        self.n2.add_edge('n1', DocNode.EDGE_TYPE_IMPORT)
+        self.n3.add_edge('n1', DocNode.EDGE_TYPE_FORK)
+        self.n3.add_edge('n2', DocNode.EDGE_TYPE_USE)
+
+        self.docnodes = [self.n1, self.n2, self.n3]
+        self.exporter = ColumnarExporter(DocNode.EDGE_TYPES)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIRECTORY, ignore_errors=True)
+
+    def test_write_edgeArrays(self):
+        self.exporter.write(self.docnodes, TEST_DIRECTORY)
+        columns = load_columns(TEST_DIRECTORY)
+
+        self.assertEqual(list(columns['edge_source']), [0, 0, 1])
+        self.assertEqual(list(columns['edge_target']), [1, 2, 2])
+        types = [get_string(columns, 'edge_type_names', t)
+                 for t in columns['edge_type']]
+        self.assertEqual(types, ['import', 'fork', 'use'])
+
+    def test_write_stringTables(self):
+        self.exporter.write(self.docnodes, TEST_DIRECTORY)
+        columns = load_columns(TEST_DIRECTORY)
+
+        self.assertEqual([get_string(columns, 'node_name', i) for i in range(3)],
+                         ['n1', 'n2', 'n3'])
+        self.assertEqual(get_string(columns, 'node_filepath', 2), '/ünïcode/n3')
+        self.assertEqual(get_string(columns, 'node_notes', 0), 'first node')
+        self.assertEqual(get_string(columns, 'node_notes', 1), '')
+
+    def test_load_memoryMapped(self):
+        self.exporter.write(self.docnodes, TEST_DIRECTORY)
+
+        columns = load_columns(TEST_DIRECTORY)
+        self.assertIsInstance(columns['edge_source'], numpy.memmap)
+
+        columns = load_columns(TEST_DIRECTORY, mmap_mode=None)
+        self.assertNotIsInstance(columns['edge_source'], numpy.memmap)
+
+    def test_write_noEdges(self):
+        self.exporter.write([DocNode('lonely', '/lonely')], TEST_DIRECTORY)
+        columns = load_columns(TEST_DIRECTORY)
+
+        self.assertEqual(len(columns['edge_source']), 0)
+        self.assertEqual(get_string(columns, 'node_name', 0), 'lonely')
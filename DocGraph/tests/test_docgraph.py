@@ -0,0 +1,176 @@
+
+import unittest
+import shutil
+import os
+
+from create_docgraph import *
+
+TEST_DIRECTORY = '/tmp/TEST_DOCGRAPH_TMPDIR'
+
+
+def write_file(relpath, text):
+    path = os.path.join(TEST_DIRECTORY, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+class DocGraphTests(unittest.TestCase):
+
+    def setUp(self):
+        write_file('a/first.py', '@name: first\n')
+        write_file('a/second.py', '@name: second\n@imports: first, nope\n')
+        write_file('b/third.py', '@name: third\n@forks: second\n')
+        write_file('b/plain.txt', 'not annotated\n')
+
+        self.docgraph = DocGraph()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIRECTORY, ignore_errors=True)
+
+    def test_iterFiles_countsEveryFile(self):
+        paths = list(self.docgraph.iter_files([TEST_DIRECTORY]))
+
+        self.assertEqual(len(paths), 4)
+        self.assertEqual(self.docgraph.filecount, 4)
+
+    def test_parseNodes_isLazy(self):
+        paths = self.docgraph.iter_files([TEST_DIRECTORY])
+        docnodes = self.docgraph.parse_nodes(paths)
+
+        # nothing has been walked until the stream is consumed
+        self.assertEqual(self.docgraph.filecount, 0)
+        self.assertIsInstance(next(docnodes), DocNode)
+        self.assertGreater(self.docgraph.filecount, 0)
+
+    def test_uniqueNodes_laterNodeWins(self):
+        first = DocNode('same', '/first')
+        other = DocNode('other', '/other')
+        second = DocNode('same', '/second')
+
+        docnodes = list(self.docgraph.unique_nodes([first, other, second]))
+
+        self.assertEqual(docnodes, [second, other])
+
+    def test_validate_rejectsMissingEdges(self):
+        docnodes = list(self.docgraph.nodes([TEST_DIRECTORY]))
+        edges = {n.name: n.edges for n in docnodes}
+
+        self.assertEqual(edges['second'], [{'id': 'first', 'type': 'import'}])
+        self.assertEqual(edges['third'], [{'id': 'second', 'type': 'fork'}])
+        self.assertEqual(self.docgraph.rejected_edges,
+                         [{'id': 'nope', 'type': 'import'}])
+
+    def test_graph_matchesViewerFormat(self):
+        graph = self.docgraph.graph(self.docgraph.nodes([TEST_DIRECTORY]))
+
+        self.assertEqual(sorted(n['id'] for n in graph['nodes']),
+                         ['first', 'second', 'third'])
+        self.assertEqual(len(graph['edges']), 2)
+        for node in graph['nodes']:
+            self.assertEqual(node['size'], 10)
+            self.assertIsNotNone(node['color'])
+
+    def test_reuse_resetsRunStats(self):
+        list(self.docgraph.nodes([TEST_DIRECTORY]))
+        list(self.docgraph.nodes([os.path.join(TEST_DIRECTORY, 'b')]))
+
+        self.assertEqual(self.docgraph.filecount, 2)
+        self.assertEqual(self.docgraph.rejected_edges,
+                         [{'id': 'second', 'type': 'fork'}])
+
+    def test_parseNodes_skipsFilesOverLimits(self):
+        path = write_file('b/huge.min.js', '@name: huge\n' + 'x' * 200)
+        self.docgraph.limits = FileLimits(max_line_length=100)
+
+        names = [n.name for n in self.docgraph.nodes([TEST_DIRECTORY])]
+
+        self.assertNotIn('huge', names)
+        self.assertEqual(len(self.docgraph.skipped_files), 1)
+        self.assertEqual(self.docgraph.skipped_files[0][0], path)
+
+    def test_graph_neighborLists(self):
+        graph = self.docgraph.graph(self.docgraph.nodes([TEST_DIRECTORY]))
+        index = {n['id']: i for i, n in enumerate(graph['nodes'])}
+        nodes = {n['id']: n for n in graph['nodes']}
+
+        self.assertEqual(nodes['second']['neighbors'],
+                         sorted([index['first'], index['third']]))
+        self.assertEqual(nodes['first']['neighbors'], [index['second']])
+        for name, node in nodes.items():
+            for i in node['incident_edges']:
+                edge = graph['edges'][i]
+                self.assertIn(name, (edge['source'], edge['target']))
+            self.assertNotIn('upstream', node)
+
+    def test_graph_upstreamLists(self):
+        self.docgraph.upstream_depth = 1
+        graph = self.docgraph.graph(self.docgraph.nodes([TEST_DIRECTORY]))
+        index = {n['id']: i for i, n in enumerate(graph['nodes'])}
+        nodes = {n['id']: n for n in graph['nodes']}
+
+        self.assertEqual(nodes['third']['upstream'], [index['second']])
+        self.assertEqual(nodes['first']['upstream'], [])
+
+        self.docgraph.upstream_depth = 2
+        graph = self.docgraph.graph(self.docgraph.nodes([TEST_DIRECTORY]))
+        nodes = {n['id']: n for n in graph['nodes']}
+
+        self.assertEqual(nodes['third']['upstream'],
+                         sorted([index['first'], index['second']]))
+
+    def test_byComponent_largestFirst(self):
+        write_file('c/fourth.py', '@name: fourth\n')
+        write_file('c/fifth.py', '@name: fifth\n@uses: fourth\n')
+
+        docnodes = self.docgraph.by_component(self.docgraph.nodes([TEST_DIRECTORY]))
+        names = [n.name for n in docnodes]
+
+        self.assertEqual(set(names[:3]), {'first', 'second', 'third'})
+        self.assertEqual(names[3:], ['fourth', 'fifth'])
+
+    def test_writeJson_compact(self):
+        outfname = os.path.join(TEST_DIRECTORY, 'output.json')
+        graph = self.docgraph.graph(self.docgraph.nodes([TEST_DIRECTORY]))
+
+        self.docgraph.write_json(graph, outfname)
+
+        with open(outfname) as f:
+            text = f.read()
+        self.assertEqual(json.loads(text), graph)
+        self.assertNotIn('\n', text)
+
+    def test_writeChunks_keepsComponentsWhole(self):
+        write_file('c/fourth.py', '@name: fourth\n')
+        write_file('c/fifth.py', '@name: fifth\n@uses: fourth\n')
+        write_file('c/sixth.py', '@name: sixth\n')
+        outfname = os.path.join(TEST_DIRECTORY, 'output.json')
+
+        docnodes = self.docgraph.by_component(self.docgraph.nodes([TEST_DIRECTORY]))
+        graph = self.docgraph.graph(docnodes)
+        self.docgraph.write_chunks(graph, outfname, 2)
+
+        with open(outfname) as f:
+            manifest = json.load(f)
+        chunks = []
+        for fname in manifest['chunks']:
+            with open(os.path.join(TEST_DIRECTORY, fname)) as f:
+                chunks.append(json.load(f))
+
+        self.assertEqual([[n['id'] for n in c['nodes']] for c in chunks],
+                         [[n['id'] for n in graph['nodes'][:3]],
+                          ['fourth', 'fifth'],
+                          ['sixth']])
+        self.assertEqual(sum([c['nodes'] for c in chunks], []), graph['nodes'])
+        self.assertEqual(sum([c['edges'] for c in chunks], []), graph['edges'])
+        self.assertEqual(manifest['node_count'], 6)
+
+    def test_writeChunks_unorderedGraph(self):
+        outfname = os.path.join(TEST_DIRECTORY, 'output.json')
+        graph = {'nodes': [{'id': 'a'}, {'id': 'b'}, {'id': 'c'}],
+                 'edges': [{'id': 'c_e0', 'source': 'b', 'target': 'c'},
+                           {'id': 'a_e0', 'source': 'a', 'target': 'a'}]}
+
+        with self.assertRaises(Exception):
+            self.docgraph.write_chunks(graph, outfname, 1)
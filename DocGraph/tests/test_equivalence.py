@@ -0,0 +1,460 @@
+
+import unittest
+import shutil
+import tempfile
+import itertools
+import time
+import tracemalloc
+
+from CrawlCheckpoint import *
+from create_docgraph import *
+
+try:
+    import numpy
+    from ColumnarExporter import *
+    from ForkDetector import *
+except ImportError:
+    numpy = None
+
+# time budgets are multiples of how long it takes, on the same machine in
+# the same run, to read every file of the tree whole and search it once
+# (see reference_scan), the way parse_docfile used to. On trees of small
+# files, mapping each file and building the graph cost more than reading
+# them (most modes take 3-6 times the reference, and signing every file
+# for forks a little more); on a large report reading is nearly all the
+# work, and scanning it can't be much slower than reading it
+TREE_SECONDS_FACTOR = 10
+MODE_SECONDS_FACTORS = {'forks': 15}
+REPORT_SECONDS_FACTOR = 1.5
+# for timer and scheduler noise
+BASE_SECONDS = 0.01
+
+# and memory budgets are a fixed part (for things like the block buffers
+# of read_blocks and scan_mmap) plus a part per file in the tree
+BASE_PEAK_BYTES = 4 * 1024 * 1024
+PEAK_BYTES_PER_FILE = 8 * 1024
+# and going from the small tree to the large one can't cost more than
+# this many times the growth in files (linear growth gives about 1), so
+# anything quadratic fails too
+GROWTH_TOLERANCE = 2
+GROWTH_SLACK_SECONDS = 0.02
+GROWTH_SLACK_BYTES = 256 * 1024
+
+SMALL_TREE_FILES = 150
+LARGE_TREE_FILES = 600
+REPORT_BYTES = 32 * 1024 * 1024
+# scanning the report mustn't hold more than a fraction of it
+REPORT_PEAK_BYTES = REPORT_BYTES // 4
+
+# small enough that the trees can have lines on both sides of it
+LIMITS = FileLimits(max_line_length=200)
+
+# the ways files are written, beyond plain \n-terminated utf-8 text,
+# that the scan modes have to agree on
+FILE_KINDS = ['lf'] * 8 + ['crlf', 'cr', 'no_final_newline', 'undecodable',
+                           'long_line', 'max_length_line', 'no_newlines']
+
+
+def generate_tree(dirname, seed, file_count, decodable=False):
+    '''
+        writes a random tree of annotated and plain files to dirname: nested
+        directories, reused names, imports/forks/uses of existing and missing
+        names, an import chain as deep as a quarter of the tree, AUTO
+        imports in R files, every one of FILE_KINDS, scattered modification
+        times, unannotated copies of other files, and one large minified
+        file. decodable leaves the undecodable bytes out, and nothing else
+    '''
+    rng = random.Random(seed)
+    directories = [dirname]
+    names = []
+    chain = []
+    # (code, tail) of files long enough to be copied
+    copyable = []
+    for i in range(file_count):
+        if rng.random() < 0.1:
+            directory = os.path.join(rng.choice(directories), 'd{}'.format(i))
+            os.makedirs(directory)
+            directories.append(directory)
+        directory = rng.choice(directories)
+
+        if rng.random() < 0.2:
+            path = os.path.join(directory, 'plain{}.txt'.format(i))
+            with open(path, 'w') as f:
+                f.write('no annotations here\n' * rng.randrange(1, 20))
+            continue
+
+        if len(names) > 0 and rng.random() < 0.05:
+            name = rng.choice(names)  # a later file with the same name wins
+        else:
+            name = 'n{}'.format(i)
+            names.append(name)
+
+        def some_names():
+            count = rng.choice([0, 0, 0, 0, 1, 2])
+            return [rng.choice(names) if rng.random() < 0.8 else 'missing{}'.format(i)
+                    for j in range(count)]
+
+        kind = rng.choice(FILE_KINDS)
+        is_r = rng.random() < 0.15
+        path = os.path.join(directory, 'f{}.{}'.format(i, 'R' if is_r else 'py'))
+        code = ['x = {}'.format(rng.random()) for j in range(rng.randrange(0, 30))]
+        tail = rng.randrange(0, 10)
+        if len(copyable) > 0 and rng.random() < 0.05:
+            # a fork without an @forks annotation: a line added to a copy
+            code, tail = rng.choice(copyable)
+            code = code + ['x = 0']
+        elif len(code) >= 10:
+            copyable.append((code, tail))
+        lines = ['# header {}'.format(i)] + code
+        if kind == 'long_line':
+            lines.append('z' * (LIMITS.max_line_length + rng.randrange(1, 50)))
+        elif kind == 'max_length_line':
+            lines.append('z' * LIMITS.max_line_length)
+        lines.append('# @name: {}'.format(name))
+        if rng.random() < 0.5:
+            lines.append('# @notes: note {}'.format(rng.random()))
+        imports = some_names()
+        if rng.random() < 0.25:
+            if len(chain) > 0:
+                imports.append(chain[-1])
+            chain.append(name)
+        if is_r and rng.random() < 0.5:
+            imports.append('AUTO')
+            for other in range(rng.randrange(0, 3)):
+                lines.append('source("f{}.R")'.format(rng.randrange(file_count)))
+        if len(imports) > 0:
+            lines.append('# @imports: {}'.format(', '.join(imports)))
+        for annotation in ('forks', 'uses'):
+            identifiers = some_names()
+            if len(identifiers) > 0:
+                lines.append('# @{}: {}'.format(annotation, ', '.join(identifiers)))
+
+        if kind == 'no_final_newline':
+            # the last annotation has no line ending, so it doesn't count
+            contents = '\n'.join(lines)
+        elif kind == 'no_newlines':
+            contents = ' '.join(lines)
+        else:
+            lines += ['y = {}'.format(j) for j in range(tail)]
+            separator = {'crlf': '\r\n', 'cr': '\r'}.get(kind, '\n')
+            contents = separator.join(lines) + separator
+        contents = contents.encode('utf-8')
+        if kind == 'undecodable' and not decodable:
+            contents += b'\xff\xfe\xe9 latin-1, not utf-8\n'
+        with open(path, 'wb') as f:
+            f.write(contents)
+
+        mtime = 1500000000 + rng.randrange(10 ** 6)
+        os.utime(path, (mtime, mtime))
+
+    # no newlines and an annotation every hundred bytes: every line-based
+    # search that isn't bounded by the line limit goes quadratic on it
+    with open(os.path.join(dirname, 'minified.js'), 'w') as f:
+        for i in range(10000):
+            f.write('@uses: n0 ' + 'x' * 90)
+
+    return file_count
+
+
+def generate_report(dirname):
+    '''
+        writes a few annotated files and a long generated report that has
+        its annotations at the bottom to dirname
+    '''
+    for i in range(5):
+        with open(os.path.join(dirname, 'r{}.py'.format(i)), 'w') as f:
+            f.write('# @name: r{}\n# @imports: r{}\n'.format(i, (i + 1) % 5))
+
+    line = 'value = compute(0.5, "{}")\n'.format('x' * 40)
+    block = line * 10000
+    with open(os.path.join(dirname, 'report.txt'), 'w') as f:
+        for i in range(REPORT_BYTES // len(block)):
+            f.write(block)
+        f.write('# @name: report\n# @imports: r0, r3\n')
+
+
+def reference_scan(dirname):
+    '''
+        reads every file in dirname whole and searches it once, the way
+        parse_docfile used to: what the time budgets are multiples of
+    '''
+    for root, dirs, files in os.walk(dirname):
+        for fname in files:
+            with open(os.path.join(root, fname), 'r', errors='replace') as f:
+                ANNOTATION_REGEXES['name'].search(f.read())
+
+
+def best_time(function, *args):
+    times = []
+    for i in range(3):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def normalize(graph, rejected_edges, skipped_files, dirname):
+    '''
+        the parts of a run that every mode has to agree on, independent of
+        node and edge order and of where the tree is
+    '''
+    nodes = {}
+    for node in graph['nodes']:
+        nodes[node['id']] = (os.path.relpath(node['filepath'], dirname),
+                             node['notes'], node['last_modified'],
+                             node.get('stale'), node.get('stale_count'),
+                             node.get('stale_depth'))
+    edges = sorted((e['source'], e['target'], e['semantic_type']) for e in graph['edges'])
+    rejected = sorted((e['id'], e['type']) for e in rejected_edges)
+    # only the paths: for a file that breaks a limit and can't be decoded
+    # either, the scan modes can give different reasons
+    skipped = sorted(os.path.relpath(path, dirname) for path, reason in skipped_files)
+
+    component = {name: {name} for name in nodes}
+    for source, target, semantic_type in edges:
+        if component[source] is not component[target]:
+            merged = component[source] | component[target]
+            for name in merged:
+                component[name] = merged
+    components = sorted(sorted(c) for c in {id(c): c for c in component.values()}.values())
+
+    return {'nodes': nodes, 'edges': edges, 'rejected': rejected,
+            'skipped': skipped, 'components': components}
+
+
+class EquivalenceTests(unittest.TestCase):
+    '''
+        runs every way of generating a graph over random trees, and checks
+        each against the plain serial run
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        # (tree, the same tree without undecodable bytes, file count)
+        cls.trees = []
+        for seed, file_count in [(0, SMALL_TREE_FILES), (1, SMALL_TREE_FILES),
+                                 (2, LARGE_TREE_FILES)]:
+            dirname = os.path.join(cls.tmpdir, 'tree{}'.format(seed))
+            decodable = os.path.join(cls.tmpdir, 'decodable{}'.format(seed))
+            os.makedirs(dirname)
+            os.makedirs(decodable)
+            generate_tree(dirname, seed, file_count)
+            generate_tree(decodable, seed, file_count, decodable=True)
+            cls.trees.append((dirname, decodable, file_count))
+
+        cls.report = os.path.join(cls.tmpdir, 'report')
+        os.makedirs(cls.report)
+        generate_report(cls.report)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir, ignore_errors=True)
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(dir=self.tmpdir)
+        self.limits = LIMITS
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def measure(self, mode, dirname):
+        '''
+            returns (the best of three run times, peak traced memory)
+        '''
+        seconds = best_time(mode, dirname)
+
+        # measured separately, since tracing slows everything down
+        tracemalloc.start()
+        try:
+            mode(dirname)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return seconds, peak
+
+    def check_mode(self, mode, decodable=False):
+        '''
+            mode(directory) -> (graph, rejected edges, skipped files). Checks
+            it against the serial run on every tree (on the decodable copy
+            of it, with decodable), and that it stays within the budgets
+            and grows linearly with the tree
+        '''
+        factor = MODE_SECONDS_FACTORS.get(mode.__name__, TREE_SECONDS_FACTOR)
+        costs = []
+        for dirname, decodable_dirname, file_count in self.trees:
+            expected_dirname = decodable_dirname if decodable else dirname
+            self.assertEqual(normalize(*mode(dirname), dirname),
+                             normalize(*self.serial(expected_dirname), expected_dirname))
+
+            seconds, peak = self.measure(mode, dirname)
+            self.assertLess(seconds, factor * best_time(reference_scan, dirname) + BASE_SECONDS)
+            self.assertLess(peak, BASE_PEAK_BYTES + PEAK_BYTES_PER_FILE * file_count)
+            costs.append((file_count, seconds, peak))
+
+        (small_count, small_seconds, small_peak) = costs[0]
+        (large_count, large_seconds, large_peak) = costs[-1]
+        growth = GROWTH_TOLERANCE * large_count / small_count
+        self.assertLess(large_seconds, growth * small_seconds + GROWTH_SLACK_SECONDS)
+        self.assertLess(large_peak, growth * small_peak + GROWTH_SLACK_BYTES)
+
+    def serial(self, dirname):
+        docgraph = DocGraph(limits=self.limits)
+        graph = docgraph.graph(docgraph.nodes([dirname]))
+        return graph, docgraph.rejected_edges, docgraph.skipped_files
+
+    def mmap(self, dirname):
+        docgraph = DocGraph(limits=self.limits, scan_mode=SCAN_MODE_MMAP)
+        graph = docgraph.graph(docgraph.nodes([dirname]))
+        return graph, docgraph.rejected_edges, docgraph.skipped_files
+
+    def mmap_strict(self, dirname):
+        docgraph = DocGraph(limits=self.limits, scan_mode=SCAN_MODE_MMAP_STRICT)
+        graph = docgraph.graph(docgraph.nodes([dirname]))
+        return graph, docgraph.rejected_edges, docgraph.skipped_files
+
+    def resumed(self, dirname):
+        checkpoint = CrawlCheckpoint(os.path.join(self.workdir, 'checkpoint'))
+
+        # stop the crawl partway through, as if it had been killed
+        crawl = DocGraph(limits=self.limits).crawl([dirname], checkpoint)
+        list(itertools.islice(crawl, 30))
+        checkpoint.abandon()
+
+        docgraph = DocGraph(limits=self.limits)
+        graph = docgraph.graph(docgraph.nodes([dirname], checkpoint, resume=True))
+        checkpoint.remove()
+        return graph, docgraph.rejected_edges, docgraph.skipped_files
+
+    def chunked(self, dirname):
+        docgraph = DocGraph(limits=self.limits)
+        graph = docgraph.graph(docgraph.by_component(docgraph.nodes([dirname])))
+        outfname = os.path.join(self.workdir, 'output.json')
+        docgraph.write_chunks(graph, outfname, 25)
+
+        # put the chunks back together, the way the viewer does
+        with open(outfname) as f:
+            manifest = json.load(f)
+        reassembled = {'nodes': [], 'edges': []}
+        for fname in manifest['chunks']:
+            with open(os.path.join(self.workdir, fname)) as f:
+                chunk = json.load(f)
+            reassembled['nodes'] += chunk['nodes']
+            reassembled['edges'] += chunk['edges']
+        self.assertEqual(len(reassembled['nodes']), manifest['node_count'])
+        self.assertEqual(len(reassembled['edges']), manifest['edge_count'])
+        return reassembled, docgraph.rejected_edges, docgraph.skipped_files
+
+    def streamed(self, dirname):
+        # every stage chained by hand, consuming the output one node at a time
+        docgraph = DocGraph(limits=self.limits)
+        docnodes = docgraph.parse_nodes(docgraph.iter_files([dirname]))
+        docnodes = docgraph.unique_nodes(docnodes)
+        docnodes = docgraph.resolve_auto_imports(docnodes)
+        docnodes = docgraph.validate(docnodes)
+        docnodes = docgraph.staleness(docnodes)
+        docnodes = docgraph.color(docnodes)
+        graph = {'nodes': [], 'edges': []}
+        for node, node_edges in docgraph.serialize(docnodes):
+            graph['nodes'].append(node)
+            graph['edges'] += node_edges
+        return graph, docgraph.rejected_edges, docgraph.skipped_files
+
+    def metrics(self, dirname):
+        docgraph = DocGraph(limits=self.limits, metrics=True, upstream_depth=2)
+        graph = docgraph.graph(docgraph.nodes([dirname]))
+        return graph, docgraph.rejected_edges, docgraph.skipped_files
+
+    def forks(self, dirname):
+        docgraph = DocGraph(limits=self.limits, fork_detector=ForkDetector())
+        graph = docgraph.graph(docgraph.nodes([dirname]))
+        self.suggested_forks = docgraph.suggested_forks
+        # everything but the suggestions has to match
+        graph['edges'] = [e for e in graph['edges']
+                          if e['semantic_type'] != DocNode.EDGE_TYPE_SUGGESTED_FORK]
+        return graph, docgraph.rejected_edges, docgraph.skipped_files
+
+    def columnar(self, dirname):
+        docgraph = DocGraph(limits=self.limits)
+        docnodes = list(docgraph.nodes([dirname]))
+        docgraph.write_columnar(docnodes, self.workdir)
+
+        columns = load_columns(self.workdir)
+        names = [get_string(columns, 'node_name', i) for i in range(len(docnodes))]
+        types = [get_string(columns, 'edge_type_names', t)
+                 for t in range(len(DocNode.EDGE_TYPES))]
+        graph = {'nodes': [], 'edges': []}
+        for i, name in enumerate(names):
+            notes = get_string(columns, 'node_notes', i)
+            # staleness isn't one of the columns
+            graph['nodes'].append({'id': name,
+                                   'filepath': get_string(columns, 'node_filepath', i),
+                                   'notes': notes if notes != '' else 'No Notes',
+                                   'last_modified': get_string(columns, 'node_last_modified', i),
+                                   'stale': docnodes[i].metrics['stale'],
+                                   'stale_count': docnodes[i].metrics['stale_count'],
+                                   'stale_depth': docnodes[i].metrics['stale_depth']})
+        for source, target, etype in zip(columns['edge_source'], columns['edge_target'],
+                                         columns['edge_type']):
+            graph['edges'].append({'source': names[source], 'target': names[target],
+                                   'semantic_type': types[etype]})
+        return graph, docgraph.rejected_edges, docgraph.skipped_files
+
+    def test_mmap(self):
+        # undecodable bytes outside annotations don't matter to it
+        self.check_mode(self.mmap, decodable=True)
+
+    def test_mmap_strict(self):
+        self.check_mode(self.mmap_strict)
+
+    def test_resumed(self):
+        self.check_mode(self.resumed)
+
+    def test_chunked(self):
+        self.check_mode(self.chunked)
+
+    def test_streamed(self):
+        self.check_mode(self.streamed)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_metrics(self):
+        self.check_mode(self.metrics)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_columnar(self):
+        self.check_mode(self.columnar)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_forks(self):
+        self.check_mode(self.forks)
+        # the trees have unannotated copies for it to find
+        self.assertNotEqual(self.suggested_forks, [])
+
+    def test_serial_budget(self):
+        self.check_mode(self.serial)
+
+    def test_report(self):
+        # a large file, where scanning is all the work, with the default
+        # limits: LIMITS.max_line_length is far shorter than a real one
+        self.limits = FileLimits()
+        expected = normalize(*self.serial(self.report), self.report)
+        self.assertIn('report', expected['nodes'])
+        reference_seconds = best_time(reference_scan, self.report)
+        for mode in (self.serial, self.mmap, self.mmap_strict, self.streamed):
+            with self.subTest(mode=mode.__name__):
+                self.assertEqual(normalize(*mode(self.report), self.report), expected)
+                seconds, peak = self.measure(mode, self.report)
+                self.assertLess(seconds, REPORT_SECONDS_FACTOR * reference_seconds + BASE_SECONDS)
+                self.assertLess(peak, REPORT_PEAK_BYTES)
+
+    def test_trees_nontrivial(self):
+        # make sure the random trees exercise what the modes could disagree on
+        for dirname, decodable_dirname, file_count in self.trees:
+            result = normalize(*self.serial(dirname), dirname)
+            self.assertGreater(len(result['nodes']), file_count / 3)
+            self.assertGreater(len(result['rejected']), 0)
+            self.assertGreater(len(result['skipped']), 1)
+            self.assertGreater(len(result['components']), 1)
+            self.assertIn('import', [e[2] for e in result['edges']])
+            self.assertIn('fork', [e[2] for e in result['edges']])
+            self.assertTrue(any(n[3] for n in result['nodes'].values()))
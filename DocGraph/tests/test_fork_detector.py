@@ -0,0 +1,150 @@
+
+import unittest
+import shutil
+
+from create_docgraph import *
+
+try:
+    import numpy
+    from ForkDetector import *
+except ImportError:
+    numpy = None
+
+TEST_DIRECTORY = '/tmp/TEST_FORKS_TMPDIR'
+
+
+def body(seed, lines=60):
+    rng = random.Random(seed)
+    return ''.join('value_{} = compute({}, {})\n'.format(i, rng.random(), rng.random())
+                   for i in range(lines))
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ForkDetectorTests(unittest.TestCase):
+
+    def setUp(self):
+        shutil.rmtree(TEST_DIRECTORY, ignore_errors=True)
+        os.makedirs(TEST_DIRECTORY)
+
+        original = body(1)
+        # the fork changes its annotations and one line
+        forked = original.replace('value_30 =', 'value_30 = 2 *')
+        self.write('original', '# @name: original\n' + original, mtime=1000)
+        self.write('forked', '# @name: forked\n# @notes: copy\n' + forked, mtime=2000)
+        self.write('other', '# @name: other\n' + body(2), mtime=1500)
+        self.cache_path = os.path.join(TEST_DIRECTORY, 'signatures')
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIRECTORY, ignore_errors=True)
+
+    def write(self, fname, contents, mtime):
+        path = os.path.join(TEST_DIRECTORY, fname)
+        with open(path, 'w') as f:
+            f.write(contents)
+        os.utime(path, (mtime, mtime))
+
+    def docgraph(self):
+        return DocGraph(fork_detector=ForkDetector(cache_path=self.cache_path))
+
+    def test_suggestions(self):
+        docgraph = self.docgraph()
+        docnodes = {n.name: n for n in docgraph.nodes([TEST_DIRECTORY])}
+
+        self.assertEqual([s[:2] for s in docgraph.suggested_forks],
+                         [('original', 'forked')])
+        self.assertGreater(docgraph.suggested_forks[0][2], 0.8)
+        edge = docnodes['forked'].graph_edges()[0]
+        self.assertEqual(edge['source'], 'original')
+        self.assertEqual(edge['semantic_type'], DocNode.EDGE_TYPE_SUGGESTED_FORK)
+        self.assertEqual(edge['similarity'], docgraph.suggested_forks[0][2])
+        self.assertEqual(docnodes['other'].edges, [])
+
+    def test_suggestions_annotatedFork(self):
+        with open(os.path.join(TEST_DIRECTORY, 'forked'), 'a') as f:
+            f.write('# @forks: original\n')
+        docgraph = self.docgraph()
+        docnodes = {n.name: n for n in docgraph.nodes([TEST_DIRECTORY])}
+
+        self.assertEqual(docgraph.suggested_forks, [])
+        self.assertEqual([e['type'] for e in docnodes['forked'].edges],
+                         [DocNode.EDGE_TYPE_FORK])
+
+    def test_cache(self):
+        docgraph = self.docgraph()
+        list(docgraph.nodes([TEST_DIRECTORY]))
+        self.assertEqual(docgraph.fork_detector.hashed_count, 3)
+
+        # only the file that changed is hashed again
+        self.write('other', '# @name: other\n' + body(3), mtime=3000)
+        docgraph = self.docgraph()
+        list(docgraph.nodes([TEST_DIRECTORY]))
+        self.assertEqual(docgraph.fork_detector.hashed_count, 1)
+        self.assertEqual(len(docgraph.suggested_forks), 1)
+        self.assertIsInstance(docgraph.fork_detector.cache_matrix, numpy.memmap)
+        self.assertEqual(numpy.load(self.cache_path + '.npy').dtype, numpy.uint32)
+
+    def test_reusedDetector(self):
+        docgraph = self.docgraph()
+        for run in range(3):
+            list(docgraph.nodes([TEST_DIRECTORY]))
+            # nothing changed, so nothing is hashed again or stored twice
+            self.assertEqual(docgraph.fork_detector.hashed_count, 3 if run == 0 else 0)
+            self.assertEqual(docgraph.fork_detector.row_count, 3)
+            self.assertEqual(len(docgraph.suggested_forks), 1)
+        self.assertEqual(len(numpy.load(self.cache_path + '.npy')), 3)
+
+        self.write('other', '# @name: other\n' + body(3), mtime=3000)
+        list(docgraph.nodes([TEST_DIRECTORY]))
+        self.assertEqual(docgraph.fork_detector.hashed_count, 1)
+        self.assertEqual(docgraph.fork_detector.row_count, 3)
+
+    def test_fileSignature_limits(self):
+        path = os.path.join(TEST_DIRECTORY, 'original')
+        detector = ForkDetector()
+        with self.assertRaises(FileLimitError):
+            detector.file_signature(path, FileLimits(max_bytes=100))
+
+        # a file that can't be signed within limits isn't a candidate
+        detector.add(path, FileLimits(max_bytes=100))
+        self.assertNotIn(path, detector.signatures)
+
+    def test_fileSignature_undecodableBytes(self):
+        path = os.path.join(TEST_DIRECTORY, 'original')
+        detector = ForkDetector()
+        expected = detector.file_signature(path)
+        with open(path, 'ab') as f:
+            f.write(b'\xff\xfe\n')
+
+        # still signed, and the same file but for a line
+        self.assertGreater((detector.file_signature(path) == expected).mean(), 0.8)
+
+    def test_fileSignature_keepsDecorators(self):
+        path = os.path.join(TEST_DIRECTORY, 'decorated')
+        self.write('decorated', '@user_required\n@forked_from\n# @uses: x\n', mtime=1000)
+        self.write('plain', '@user_required\n@forked_from\n', mtime=1000)
+        self.write('other', '@admin_required\n@forked_from\n', mtime=1000)
+        detector = ForkDetector()
+
+        plain = detector.file_signature(os.path.join(TEST_DIRECTORY, 'plain'))
+        other = detector.file_signature(os.path.join(TEST_DIRECTORY, 'other'))
+        # only the annotation is left out
+        self.assertTrue((detector.file_signature(path) == plain).all())
+        self.assertFalse((plain == other).all())
+
+    def test_fileSignature_foldsBlocks(self):
+        path = os.path.join(TEST_DIRECTORY, 'original')
+        detector = ForkDetector()
+        expected = detector.file_signature(path)
+
+        # folding a few hashes at a time gives the same minimum
+        detector.BLOCK_SIZE = 7
+        self.assertTrue((detector.file_signature(path) == expected).all())
+
+    def test_signature_similarity(self):
+        detector = ForkDetector()
+        a = detector.signature(numpy.arange(1000, dtype=numpy.uint64))
+        b = detector.signature(numpy.arange(500, 1500, dtype=numpy.uint64))
+
+        # jaccard similarity is 500 / 1500
+        self.assertAlmostEqual((a == b).mean(), 1 / 3, delta=0.15)
+        self.assertIsNone(detector.signature(numpy.array([], dtype=numpy.uint64)))
@@ -0,0 +1,115 @@
+
+import unittest
+
+from create_docgraph import *
+
+try:
+    import numpy
+    from GraphMetrics import *
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class GraphMetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        # a hub that everything depends on, a chain hanging off it,
+        # a two-node loop and a loner
+        self.hub = DocNode('hub', '/hub')
+        self.a = DocNode('a', '/a')
+        self.b = DocNode('b', '/b')
+        self.c = DocNode('c', '/c')
+        self.d = DocNode('d', '/d')
+        self.e = DocNode('e', '/e')
+        self.loner = DocNode('loner', '/loner')
+
+        self.a.add_edge('hub', DocNode.EDGE_TYPE_IMPORT)
+        self.b.add_edge('hub', DocNode.EDGE_TYPE_IMPORT)
+        self.c.add_edge('hub', DocNode.EDGE_TYPE_FORK)
+        self.c.add_edge('a', DocNode.EDGE_TYPE_USE)
+        self.d.add_edge('c', DocNode.EDGE_TYPE_IMPORT)
+        self.d.add_edge('e', DocNode.EDGE_TYPE_IMPORT)
+        self.e.add_edge('d', DocNode.EDGE_TYPE_IMPORT)
+
+        self.docnodes = [self.hub, self.a, self.b, self.c,
+                         self.d, self.e, self.loner]
+        self.metrics = GraphMetrics(DocNode.EDGE_TYPES)
+
+    def test_degrees(self):
+        metrics = self.metrics.compute(self.docnodes)
+
+        self.assertEqual(list(metrics['out_degree_import']), [2, 0, 0, 1, 1, 1, 0])
+        self.assertEqual(list(metrics['out_degree_fork']), [1, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(list(metrics['in_degree_import']), [0, 1, 1, 0, 2, 1, 0])
+        self.assertEqual(list(metrics['in_degree_use']), [0, 0, 0, 1, 0, 0, 0])
+
+    def test_fanIn_exact(self):
+        metrics = self.metrics.compute(self.docnodes)
+
+        # hub <- a, b, c, d, e; a <- c, d, e; c <- d, e; d <-> e
+        self.assertEqual(list(metrics['fan_in']), [5, 3, 0, 2, 1, 1, 0])
+
+    def test_fanIn_estimated(self):
+        metrics = GraphMetrics(DocNode.EDGE_TYPES, exact_limit=0,
+                               estimate_rounds=1024)
+        metrics = metrics.compute(self.docnodes)
+
+        self.assertTrue(numpy.allclose(metrics['fan_in'], [5, 3, 0, 2, 1, 1, 0], atol=1))
+        # only the d <-> e loop depends on d and e, and nothing depends on
+        # b or the loner, so theirs are exact
+        self.assertEqual(metrics['fan_in_estimated'].tolist(),
+                         [True, True, False, True, False, False, False])
+        self.assertFalse(self.metrics.compute(self.docnodes)['fan_in_estimated'].any())
+
+    def test_fanIn_estimateClamped(self):
+        # a big cycle: every node is reached by all the others
+        docnodes = [DocNode('n{}'.format(i), '/n{}'.format(i)) for i in range(50)]
+        for i, node in enumerate(docnodes):
+            node.add_edge('n{}'.format((i + 1) % 50), DocNode.EDGE_TYPE_IMPORT)
+        for node in docnodes[:10]:
+            node.add_edge('n0', DocNode.EDGE_TYPE_USE)
+        metrics = GraphMetrics(DocNode.EDGE_TYPES, exact_limit=0, estimate_rounds=4)
+
+        fan_in = metrics.compute(docnodes)['fan_in']
+
+        self.assertEqual(list(fan_in), [49] * 50)
+
+    def test_fanIn_longChain(self):
+        # one topological level per node; must not take a round per level
+        count = 20000
+        docnodes = [DocNode('n{}'.format(i), '/n{}'.format(i)) for i in range(count)]
+        for i in range(1, count):
+            docnodes[i].add_edge('n{}'.format(i - 1), DocNode.EDGE_TYPE_IMPORT)
+
+        for exact_limit in (count, 0):
+            started = time.monotonic()
+            metrics = GraphMetrics(DocNode.EDGE_TYPES, exact_limit=exact_limit)
+            fan_in = metrics.compute(docnodes)['fan_in']
+            self.assertLess(time.monotonic() - started, 10)
+            self.assertEqual(fan_in[-1], 0)
+            self.assertLessEqual(fan_in.max(), count - 1)
+
+    def test_pagerank(self):
+        pagerank = self.metrics.compute(self.docnodes)['pagerank']
+
+        self.assertAlmostEqual(pagerank.sum(), 1)
+        self.assertEqual(pagerank.argmax(), 0)
+        self.assertGreater(pagerank[1], pagerank[2])
+
+    def test_apply(self):
+        self.metrics.apply(self.docnodes)
+
+        node = self.hub.graph_node({'size': 10})
+        self.assertEqual(node['size'], 10)
+        self.assertEqual(node['fan_in'], 5)
+        self.assertFalse(node['fan_in_estimated'])
+        self.assertEqual(node['out_degree']['import'], 2)
+        self.assertLess(self.loner.size, self.hub.size)
+        json.dumps(node)
+
+    def test_apply_noEdges(self):
+        self.metrics.apply([self.loner])
+
+        self.assertEqual(self.loner.metrics['fan_in'], 0)
+        self.assertEqual(self.loner.size, 10)
@@ -89,3 +89,47 @@ class ImportManagerTests(unittest.TestCase):
 
         self.assertFalse(self.mock_identifier.can_help.called)
         self.assertFalse(self.mock_identifier.get_imports.called)
+
+    def test_addAutoImport_breaksLimits(self):
+        self.node1.add_edge('AUTO', 'import')
+
+        self.mock_identifier.can_help.return_value = True
+        self.mock_identifier.get_imports.return_value = [NODE2_FNAME]
+
+        limits = FileLimits(max_line_length=5)
+        self.manager.add_auto_imports(self.docnodes, limits)
+
+        # the over-long line is never handed to the identifier
+        self.assertFalse(self.mock_identifier.get_imports.called)
+        self.assertEqual(self.node1.edges, [])
+
+    def test_addAutoImport_blocksOfWholeLines(self):
+        text = 'library("a.R")\nsource("b.R")\n'
+        with open(NODE1_PATH, 'w') as f:
+            f.write(text)
+        self.addCleanup(self.setUpClass)
+        self.node1.add_edge('AUTO', 'import')
+
+        self.mock_identifier.can_help.return_value = True
+        self.mock_identifier.get_imports.return_value = []
+
+        with unittest.mock.patch('FileLimits.READ_BLOCK_SIZE', 4):
+            self.manager.add_auto_imports(self.docnodes)
+
+        # a file bigger than a block is handed over whole lines at a time
+        blocks = [c[0][0] for c in self.mock_identifier.get_imports.call_args_list]
+        self.assertEqual(blocks, ['library("a.R")\n', 'source("b.R")\n'])
+
+    def test_addAutoImport_undecodableBytes(self):
+        with open(NODE1_PATH, 'wb') as f:
+            f.write(b'\xff\xfe not text\n' + NODE1_TEXT.encode())
+        self.addCleanup(self.setUpClass)
+        self.node1.add_edge('AUTO', 'import')
+
+        self.mock_identifier.can_help.return_value = True
+        self.mock_identifier.get_imports.return_value = [NODE2_FNAME]
+
+        # an mmap scan lets stray bytes through, so imports have to too
+        self.manager.add_auto_imports(self.docnodes)
+
+        self.assertEqual(self.node1.edges, [{'id': 'n2', 'type': 'import'}])
@@ -1,5 +1,6 @@
 
 import unittest
+import unittest.mock
 import os
 
 from create_docgraph import *
@@ -247,3 +248,240 @@ class ParsingTests(unittest.TestCase):
                                          FORK1_EDGE, FORK2_EDGE,
                                          USE1_EDGE, USE2_EDGE])
         self.assertIsNone(docnode.notes)
+
+    ###
+    ### File Limits
+    ###
+
+    def test_parse_lineTooLong(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('@name:{}\n'.format(NAME))
+            f.write('x' * 100)
+
+        limits = FileLimits(max_line_length=50)
+        with self.assertRaises(FileLimitError):
+            parse_docfile(TEST_FILENAME, limits)
+
+    def test_parse_lineExactlyMaxLength(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('@name:{}\n'.format(NAME))
+            f.write('x' * 50 + '\n')
+            f.write('x' * 50)
+
+        limits = FileLimits(max_line_length=50)
+        docnode = parse_docfile(TEST_FILENAME, limits)
+
+        self.assertEqual(docnode.name, NAME)
+
+    def test_parse_fileTooBig(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('@name:{}\n'.format(NAME))
+            f.write('x\n' * 100)
+
+        limits = FileLimits(max_bytes=100)
+        with self.assertRaises(FileLimitError):
+            parse_docfile(TEST_FILENAME, limits)
+
+    def test_parse_withinLimits(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('x\n' * 10)
+            f.write('@name:{}\n'.format(NAME))
+            f.write('@notes: {}\n'.format(NOTE))
+
+        limits = FileLimits(max_bytes=1000, max_line_length=100, max_seconds=60)
+        docnode = parse_docfile(TEST_FILENAME, limits)
+
+        self.assertEqual(docnode.name, NAME)
+        self.assertEqual(docnode.notes, NOTE)
+
+    def test_parse_firstAnnotationWins(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('@name:{}\n'.format(NAME))
+            f.write('@name:{}\n'.format(IMPORT1))
+
+        docnode = parse_docfile(TEST_FILENAME)
+
+        self.assertEqual(docnode.name, NAME)
+
+    def test_readBlocks_wholeLines(self):
+        text = 'a\n' + 'b' * 20 + '\n\n' + 'c' * 9 + '\n' + 'd' * 15
+        with open(TEST_FILENAME, 'w') as f:
+            f.write(text)
+
+        with unittest.mock.patch('FileLimits.READ_BLOCK_SIZE', 7):
+            blocks = list(read_blocks(TEST_FILENAME, FileLimits(max_line_length=20)))
+            with self.assertRaises(FileLimitError):
+                list(read_blocks(TEST_FILENAME, FileLimits(max_line_length=19)))
+
+        self.assertEqual(''.join(blocks), text)
+        self.assertGreater(len(blocks), 2)
+        self.assertTrue(all(b.endswith('\n') for b in blocks[:-1]))
+        self.assertEqual(blocks[-1], 'd' * 15)
+
+    def test_parse_largeFileThroughput(self):
+        # annotations at the bottom of a long report: no slower than
+        # reading the file whole and searching it, the way parse_docfile
+        # used to
+        with open(TEST_FILENAME, 'w') as f:
+            line = 'value = compute(0.5, "{}")\n'.format('x' * 40)
+            f.write(line * 400000)
+            f.write('@name:{}\n@notes: {}\n'.format(NAME, NOTE))
+
+        def whole_file():
+            with open(TEST_FILENAME, 'r') as f:
+                text = f.read()
+            return [regex.search(text) for regex in ANNOTATION_REGEXES.values()]
+
+        for scan_mode in SCAN_MODES:
+            self.assertLess(best_time(lambda: parse_docfile(TEST_FILENAME, scan_mode=scan_mode)),
+                            2 * best_time(whole_file) + 0.01)
+
+    ###
+    ### Memory-Mapped Scanning
+    ###
+
+    def test_parseMmap_allFields(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('some text\n' * 100)
+            f.write('@name:{}\n'.format(NAME))
+            f.write('@imports: {},  {} \n'.format(IMPORT1, IMPORT2))
+            f.write('@fork: {}\n'.format(FORK1))
+            f.write('@uses: {},   {}\n'.format(USE1, USE2))
+            f.write('@notes: {}\n'.format(NOTE))
+
+        docnode = parse_docfile(TEST_FILENAME, scan_mode=SCAN_MODE_MMAP)
+
+        self.assertEqual(docnode.name, NAME)
+        self.assertEqual(docnode.edges, [IMPORT1_EDGE, IMPORT2_EDGE,
+                                         FORK1_EDGE, USE1_EDGE, USE2_EDGE])
+        self.assertEqual(docnode.notes, NOTE)
+
+    def test_parseMmap_matchesLineScan(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('@name: {} @notes: {}\n'.format(NAME, NOTE))
+            f.write('@name: {}\n'.format(IMPORT1))
+            f.write('@imports:\n')
+            f.write('@forks: {}'.format(FORK1))
+
+        limits = FileLimits()
+        self.assertEqual(scan_mmap(TEST_FILENAME, limits),
+                         scan_lines(TEST_FILENAME, limits))
+
+    def test_parseMmap_emptyFile(self):
+        open(TEST_FILENAME, 'w').close()
+
+        docnode = parse_docfile(TEST_FILENAME, scan_mode=SCAN_MODE_MMAP)
+
+        self.assertIsNone(docnode)
+
+    def test_parseMmap_valueTooLong(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('@name:{}\n'.format(NAME))
+            f.write('@notes: {}\n'.format('x' * 100))
+
+        limits = FileLimits(max_line_length=50)
+        with self.assertRaises(FileLimitError):
+            parse_docfile(TEST_FILENAME, limits, SCAN_MODE_MMAP)
+
+    def assertScansAgree(self, limits=None, decode_all=(False, True)):
+        limits = limits if limits is not None else FileLimits()
+        results = []
+        for scan in [scan_lines] + [lambda p, l, d=d: scan_mmap(p, l, d) for d in decode_all]:
+            try:
+                results.append(scan(TEST_FILENAME, limits))
+            except FileLimitError as e:
+                results.append(e.reason)
+        for result in results[1:]:
+            self.assertEqual(result, results[0])
+        return results[0]
+
+    def test_parseMmap_crLineEndings(self):
+        with open(TEST_FILENAME, 'wb') as f:
+            f.write('@name: {}\r@imports: {}\r'.format(NAME, IMPORT1).encode())
+
+        results = self.assertScansAgree()
+        self.assertEqual(results['imports'], ' {}'.format(IMPORT1))
+
+    def test_parseMmap_crlfLineEndings(self):
+        with open(TEST_FILENAME, 'wb') as f:
+            f.write('@name: {}\r\n@notes: {}\r\n'.format(NAME, NOTE).encode())
+
+        results = self.assertScansAgree()
+        self.assertEqual(results['notes'], ' {}'.format(NOTE))
+
+    def test_parseMmap_undecodableOutsideAnnotations(self):
+        with open(TEST_FILENAME, 'wb') as f:
+            f.write('@name: {}\n'.format(NAME).encode())
+            f.write(b'\xff\xfe not text\n')
+
+        self.assertIsNone(self.assertScansAgree(decode_all=[True]))
+        # only annotation values have to decode
+        results = scan_mmap(TEST_FILENAME, FileLimits())
+        self.assertEqual(results['name'], ' {}'.format(NAME))
+
+    def test_parseMmap_undecodableAnnotation(self):
+        with open(TEST_FILENAME, 'wb') as f:
+            f.write('@name: {}\n'.format(NAME).encode())
+            f.write(b'@notes: \xff\xfe\n')
+
+        self.assertIsNone(self.assertScansAgree())
+
+    def test_parseMmap_lineTooLong(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('@name:{}\n'.format(NAME))
+            f.write('x' * 51 + '\n')
+
+        reason = self.assertScansAgree(FileLimits(max_line_length=50))
+        self.assertEqual(reason, 'line longer than 50 characters')
+
+    def test_parseMmap_lineLimitCountsCharacters(self):
+        with open(TEST_FILENAME, 'w', encoding='utf-8') as f:
+            f.write('@name:{}\n'.format(NAME))
+            f.write('é' * 50 + '\n')
+
+        results = self.assertScansAgree(FileLimits(max_line_length=50))
+        self.assertEqual(results['name'], NAME)
+
+    def test_parseMmap_noTrailingNewline(self):
+        with open(TEST_FILENAME, 'w') as f:
+            f.write('@name:{}\n'.format(NAME))
+            f.write('@notes: {}'.format(NOTE))
+
+        results = self.assertScansAgree()
+        self.assertIsNone(results['notes'])
+
+    def test_parseMmap_noNewlinesIsFast(self):
+        # a minified file: many annotation-like strings and no newlines
+        with open(TEST_FILENAME, 'w') as f:
+            for i in range(4000):
+                f.write('@use: a' + 'x' * 993)
+
+        started = time.monotonic()
+        with self.assertRaises(FileLimitError):
+            parse_docfile(TEST_FILENAME, FileLimits(max_seconds=0.5), SCAN_MODE_MMAP)
+        self.assertLess(time.monotonic() - started, 5)
+
+        started = time.monotonic()
+        parse_docfile(TEST_FILENAME, FileLimits(max_line_length=None, max_seconds=0.5),
+                      SCAN_MODE_MMAP)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_parse_noNewlinesIsFast(self):
+        with open(TEST_FILENAME, 'w') as f:
+            for i in range(4000):
+                f.write('@use: a' + 'x' * 993)
+
+        started = time.monotonic()
+        docnode = parse_docfile(TEST_FILENAME, FileLimits(max_line_length=None))
+
+        self.assertIsNone(docnode)
+        self.assertLess(time.monotonic() - started, 5)
+
+
+def best_time(function, repeat=3):
+    times = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return min(times)
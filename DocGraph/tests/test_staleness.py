@@ -0,0 +1,95 @@
+
+import unittest
+
+from StalenessAnalyzer import *
+from create_docgraph import *
+
+
+class StalenessTests(unittest.TestCase):
+
+    def node(self, name, mtime, imports=(), forks=(), uses=()):
+        docnode = DocNode(name, '/' + name)
+        docnode.mtime = mtime
+        for identifier in imports:
+            docnode.add_edge(identifier, DocNode.EDGE_TYPE_IMPORT)
+        for identifier in forks:
+            docnode.add_edge(identifier, DocNode.EDGE_TYPE_FORK)
+        for identifier in uses:
+            docnode.add_edge(identifier, DocNode.EDGE_TYPE_USE)
+        return docnode
+
+    def test_chain(self):
+        # bob forked lib, then lib changed; rob imports bob and is older still
+        docnodes = [self.node('rob', 10, imports=['bob']),
+                    self.node('bob', 20, forks=['lib']),
+                    self.node('lib', 30),
+                    self.node('fresh', 40, imports=['lib'])]
+        results = StalenessAnalyzer().compute(docnodes)
+
+        self.assertEqual(results['lib'], {'stale': False, 'stale_count': 0, 'stale_depth': 0})
+        self.assertEqual(results['fresh'], {'stale': False, 'stale_count': 0, 'stale_depth': 0})
+        self.assertEqual(results['bob'], {'stale': True, 'stale_count': 1, 'stale_depth': 1})
+        self.assertEqual(results['rob'], {'stale': True, 'stale_count': 1, 'stale_depth': 2})
+
+    def test_transitiveOnly(self):
+        # mid is newer than top but older than base, so top is stale through mid
+        docnodes = [self.node('top', 20, imports=['mid']),
+                    self.node('mid', 10, imports=['base']),
+                    self.node('base', 30)]
+        results = StalenessAnalyzer().compute(docnodes)
+
+        self.assertEqual(results['top'], {'stale': True, 'stale_count': 1, 'stale_depth': 2})
+        self.assertEqual(results['mid']['stale_depth'], 1)
+
+    def test_count(self):
+        docnodes = [self.node('user', 10, imports=['a', 'b', 'old']),
+                    self.node('a', 20), self.node('b', 30), self.node('old', 5)]
+        results = StalenessAnalyzer().compute(docnodes)
+
+        self.assertEqual(results['user']['stale_count'], 2)
+
+    def test_cycle(self):
+        # everything in a cycle is upstream of everything else in it
+        docnodes = [self.node('a', 10, imports=['b']),
+                    self.node('b', 20, imports=['c']),
+                    self.node('c', 30, imports=['a']),
+                    self.node('d', 40, imports=['a'])]
+        results = StalenessAnalyzer().compute(docnodes)
+
+        self.assertEqual([results[n]['stale'] for n in 'abcd'], [True, True, False, False])
+        self.assertEqual(results['a']['stale_count'], 1)
+        self.assertEqual(results['a']['stale_depth'], 1)
+
+    def test_ignoredEdgesAndMissingMtimes(self):
+        docnodes = [self.node('user', 10, uses=['new']),
+                    self.node('new', 20),
+                    self.node('unknown', None, imports=['new']),
+                    self.node('importer', 15, imports=['unknown'])]
+        results = StalenessAnalyzer().compute(docnodes)
+
+        self.assertFalse(results['user']['stale'])
+        self.assertFalse(results['unknown']['stale'])
+        # the change still passes through a file without an mtime
+        self.assertTrue(results['importer']['stale'])
+
+    def test_longChain(self):
+        # deeper than python's recursion limit
+        count = 5000
+        docnodes = [self.node('n{}'.format(i), i, imports=['n{}'.format(i + 1)])
+                    for i in range(count - 1)]
+        docnodes.append(self.node('n{}'.format(count - 1), count))
+        results = StalenessAnalyzer().compute(docnodes)
+
+        self.assertEqual(results['n0']['stale_depth'], count - 1)
+        self.assertFalse(results['n{}'.format(count - 1)]['stale'])
+
+    def test_docgraphStage(self):
+        docnodes = [self.node('bob', 20, forks=['lib']), self.node('lib', 30)]
+        docgraph = DocGraph()
+        docnodes = list(docgraph.staleness(docnodes))
+
+        self.assertEqual(docgraph.stale_nodes, ['bob'])
+        node = docnodes[0].graph_node()
+        self.assertEqual((node['stale'], node['stale_count'], node['stale_depth']),
+                         (True, 1, 1))
+        self.assertEqual(docnode_from_state(docnodes[0].state()).mtime, 20)